@@ -33,7 +33,10 @@ class AboutDialog(QDialog):
             "• Add custom fields to track additional information\n"
             "• Remove books by selecting them from the table\n"
             "• View your book collection\n"
-            "• Export books to CSV, JSON, or Excel format\n"
+            "• Import books in bulk from CSV or JSON files\n"
+            "• Export books to CSV, JSON, JSON Lines (plain, gzip or Zstandard compressed), "
+            "Excel, Parquet or Arrow format; Zstandard, Parquet and Arrow need the optional "
+            "zstandard and pyarrow packages\n"
             "• MongoDB storage for persistence\n"
             "• Dark mode and customizable required fields\n\n"
             "This application is built with PyQt5 and MongoDB.\n\n"
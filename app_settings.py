@@ -0,0 +1,113 @@
+from PyQt5.QtCore import QObject, QSettings, pyqtSignal
+
+class AppSettings(QObject):
+    """Typed, cached access to the application's QSettings.
+
+    Values are read from the QSettings backend once and then served from memory;
+    writes go through to the backend and emit change signals, so the window can
+    react to a change instead of re-reading settings on every action. value()
+    and setValue() match QSettings, so this can be passed wherever QSettings was.
+    """
+    # Emitted with the key of any setting that changed
+    changed = pyqtSignal(str)
+    dark_mode_changed = pyqtSignal(bool)
+    # Emitted when whether title, author, price or a custom field is required changes
+    required_fields_changed = pyqtSignal()
+    # Emitted with the new list of custom fields
+    custom_fields_changed = pyqtSignal(list)
+
+    REQUIRED_FIELD_KEYS = ("titleRequired", "authorRequired", "priceRequired")
+
+    def __init__(self, qsettings=None, parent=None):
+        super().__init__(parent)
+        self.qsettings = qsettings or QSettings("MyCompany", "BookManagementSystem")
+        self.cache = {}
+        self.cached_custom_fields = None
+
+    def value(self, key, default=None, type=None):
+        """Return a setting, reading the backend only the first time"""
+        cache_key = (key, type)
+        if cache_key not in self.cache:
+            if type is None:
+                self.cache[cache_key] = self.qsettings.value(key, default)
+            else:
+                self.cache[cache_key] = self.qsettings.value(key, default, type=type)
+        return self.cache[cache_key]
+
+    def setValue(self, key, value):
+        """Write a setting through to the backend, signalling if it changed"""
+        value_type = type(value) if isinstance(value, (bool, int, float, str)) else None
+        unchanged = (self.qsettings.contains(key)
+                     and self.value(key, None, type=value_type) == value)
+        self.qsettings.setValue(key, value)
+        for cache_key in [cache_key for cache_key in self.cache if cache_key[0] == key]:
+            del self.cache[cache_key]
+        if unchanged:
+            return
+        self.changed.emit(key)
+        if key == "darkMode":
+            self.dark_mode_changed.emit(self.dark_mode)
+        elif key in self.REQUIRED_FIELD_KEYS:
+            self.required_fields_changed.emit()
+
+    def remove(self, key):
+        self.qsettings.remove(key)
+        self.cache.clear()
+        self.cached_custom_fields = None
+
+    def sync(self):
+        """Flush pending writes to storage"""
+        self.qsettings.sync()
+
+    @property
+    def dark_mode(self):
+        return self.value("darkMode", False, type=bool)
+
+    @property
+    def title_required(self):
+        return self.value("titleRequired", True, type=bool)
+
+    @property
+    def author_required(self):
+        return self.value("authorRequired", False, type=bool)
+
+    @property
+    def price_required(self):
+        return self.value("priceRequired", False, type=bool)
+
+    def custom_fields(self):
+        """Return a copy of the saved custom fields, as {"name", "required"} dicts"""
+        if self.cached_custom_fields is None:
+            custom_fields = []
+            size = self.qsettings.beginReadArray("customFields")
+            for i in range(size):
+                self.qsettings.setArrayIndex(i)
+                field_name = self.qsettings.value("name", "")
+                required = self.qsettings.value("required", False, type=bool)
+                custom_fields.append({"name": field_name, "required": required})
+            self.qsettings.endArray()
+            self.cached_custom_fields = custom_fields
+        return [dict(field) for field in self.cached_custom_fields]
+
+    def set_custom_fields(self, custom_fields):
+        """Save the custom fields, signalling if they changed"""
+        custom_fields = [{"name": field["name"], "required": field["required"]}
+                         for field in custom_fields]
+        if custom_fields == self.custom_fields():
+            return
+        old_required = {field["name"]: field["required"] for field in self.cached_custom_fields}
+
+        # Drop entries left over from a longer list
+        self.qsettings.remove("customFields")
+        self.qsettings.beginWriteArray("customFields")
+        for i, field in enumerate(custom_fields):
+            self.qsettings.setArrayIndex(i)
+            self.qsettings.setValue("name", field["name"])
+            self.qsettings.setValue("required", field["required"])
+        self.qsettings.endArray()
+        self.cached_custom_fields = custom_fields
+
+        self.changed.emit("customFields")
+        self.custom_fields_changed.emit(self.custom_fields())
+        if any(old_required.get(field["name"], False) != field["required"] for field in custom_fields):
+            self.required_fields_changed.emit()
@@ -0,0 +1,322 @@
+"""Headless performance benchmarks for the Book Management System.
+
+Builds synthetic collections of books, drives the main window offscreen and
+times loading, table updates, adding and removing books, every exporter,
+custom field changes and rebuilding the UI. Results are written as JSON so
+runs from different releases can be compared with --compare.
+
+Runs against MongoDB when --mongo-uri is given, using a separate database
+that is dropped afterwards, and otherwise against mongomock
+(pip install mongomock). Settings are kept in a temporary directory, so the
+application's own settings and data are left alone.
+
+Example:
+    python benchmark.py --sizes 10000,100000 --custom-fields 5 --output results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import importlib.util
+import tempfile
+from datetime import datetime, timezone
+
+# Must be set before Qt creates the application
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QSettings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Database the benchmarks write to, so a real server's books aren't touched
+BENCHMARK_DATABASE_NAME = "book_management_benchmark"
+
+# Books added and removed through the UI per size
+UI_OPERATION_COUNT = 100
+
+# Books inserted per insert_books call while generating a collection
+GENERATE_BATCH_SIZE = 10000
+
+# A run this much slower than the baseline is reported as a regression
+REGRESSION_THRESHOLD = 1.10
+
+TITLE_WORDS = ["Shadow", "River", "Empire", "Garden", "Night", "Silver", "Last", "Winter",
+               "Secret", "Ocean", "Iron", "Crown", "Forgotten", "Storm", "Glass", "Journey"]
+FIRST_NAMES = ["Ada", "Bram", "Clara", "Dmitri", "Elena", "Farid", "Greta", "Hiro",
+               "Ines", "Jonas", "Kemi", "Luis", "Mira", "Nils", "Olga", "Priya"]
+LAST_NAMES = ["Adler", "Brooks", "Castillo", "Dubois", "Eriksen", "Fischer", "Garcia",
+              "Haddad", "Ivanova", "Jensen", "Kowalski", "Larsen", "Moreau", "Nakamura"]
+FIELD_VALUES = ["Fiction", "History", "Science", "Poetry", "Biography", "Travel",
+                "Hardcover", "Paperback", "Ebook", "Signed", "First edition", ""]
+
+def custom_field_names(count):
+    return [f"Field {index + 1}" for index in range(count)]
+
+def generate_books(count, custom_field_count=0, seed=0):
+    """Yield count synthetic books with the given number of custom fields"""
+    rng = random.Random(seed)
+    field_names = custom_field_names(custom_field_count)
+    for index in range(count):
+        book = {
+            'title': f"{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} {index}",
+            'author_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'price': round(rng.uniform(1, 80), 2),
+        }
+        for field_name in field_names:
+            book[field_name] = rng.choice(FIELD_VALUES)
+        yield book
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == "darwin":
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+def use_mongomock():
+    """Make DatabaseHandler connect to an in-process mongomock server"""
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("mongomock is required without --mongo-uri (pip install mongomock)")
+    import pymongo
+    client = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: client
+
+def isolate_settings(directory):
+    """Keep QSettings in a scratch directory instead of the user's settings"""
+    for settings_format in (QSettings.NativeFormat, QSettings.IniFormat):
+        QSettings.setPath(settings_format, QSettings.UserScope, directory)
+
+def configure_settings(directory, custom_field_count, mongo_uri):
+    settings = QSettings("MyCompany", "BookManagementSystem")
+    settings.clear()
+    settings.setValue("mongoDatabase", BENCHMARK_DATABASE_NAME)
+    settings.setValue("localStorePath", os.path.join(directory, "books.sqlite3"))
+    if mongo_uri:
+        settings.setValue("mongoUri", mongo_uri)
+    settings.beginWriteArray("customFields")
+    for index, field_name in enumerate(custom_field_names(custom_field_count)):
+        settings.setArrayIndex(index)
+        settings.setValue("name", field_name)
+        settings.setValue("required", False)
+    settings.endArray()
+    settings.sync()
+
+def silence_dialogs(app_module):
+    """Answer the main window's message boxes without showing them"""
+    for name in ("information", "warning", "critical"):
+        setattr(app_module.QMessageBox, name, staticmethod(lambda *args, **kwargs: None))
+
+    create_confirmation_dialog = app_module.create_confirmation_dialog
+    def confirm(*args, **kwargs):
+        msg_box = create_confirmation_dialog(*args, **kwargs)
+        msg_box.exec_ = lambda: None
+        msg_box.clickedButton = lambda: msg_box.buttons()[0]  # Yes
+        return msg_box
+    app_module.create_confirmation_dialog = confirm
+
+def settle(app, window):
+    """Run the event loop until background database work has finished"""
+    app.processEvents()
+    window.db_worker.wait_for_done()
+    app.processEvents()
+
+def open_window(app):
+    """Create the main window and wait for its database connection"""
+    import book_management_app
+    silence_dialogs(book_management_app)
+    window = book_management_app.BookManagementApp()
+    window.show()
+    while window.database_online is None:
+        settle(app, window)
+    settle(app, window)
+    # Changes from other workstations would only add noise to the timings
+    if window.sync_worker is not None:
+        window.sync_worker.stop()
+        window.sync_worker = None
+    return window
+
+class Benchmark:
+    """Times operations and collects the results"""
+    def __init__(self):
+        self.results = []
+
+    def time(self, books, operation, fn, items=1):
+        """Run fn once and record its time, throughput and the peak RSS so far"""
+        started = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - started
+        result = {
+            "books": books,
+            "operation": operation,
+            "seconds": round(seconds, 6),
+            "items": items,
+            "items_per_second": round(items / seconds, 1) if seconds > 0 else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        self.results.append(result)
+        print(f"{books:>9} books  {operation:<22} {seconds:9.3f} s  "
+              f"{result['items_per_second'] or 0:>12,.0f} items/s  "
+              f"{result['peak_rss_mb'] or 0:>8} MB peak")
+        return result
+
+def populate(db_handler, count, custom_field_count, seed):
+    """Replace the benchmark collection with count synthetic books"""
+    db_handler.books_collection.delete_many({})
+    db_handler.book_keys.clear()
+    batch = []
+    for book in generate_books(count, custom_field_count, seed):
+        batch.append(book)
+        if len(batch) >= GENERATE_BATCH_SIZE:
+            db_handler.insert_books(batch)
+            batch = []
+    if batch:
+        db_handler.insert_books(batch)
+
+def run_size(app, window, bench, count, custom_field_count, seed, output_dir):
+    from book_exporter import EXPORTERS, OPTIONAL_MODULES, export_books
+
+    bench.time(count, "generate", lambda: populate(window.db_handler, count, custom_field_count, seed),
+               items=count)
+
+    def load_books():
+        window.reload_books()
+        window.table_model.fetch_all()
+        settle(app, window)
+    bench.time(count, "load_books", load_books, items=count)
+
+    def update_table():
+        window.update_table()
+        app.processEvents()
+    bench.time(count, "update_table", update_table, items=count)
+
+    def add_books():
+        for index in range(UI_OPERATION_COUNT):
+            window.title_input.setText(f"Benchmark book {index}")
+            window.author_name_input.setText("Benchmark")
+            window.price_input.setText("9.99")
+            window.add_book()
+        settle(app, window)
+    bench.time(count, "add_book", add_books, items=UI_OPERATION_COUNT)
+
+    def remove_books():
+        for _ in range(UI_OPERATION_COUNT):
+            window.table.selectRow(0)
+            window.remove_selected_book()
+        settle(app, window)
+    bench.time(count, "remove_selected_book", remove_books, items=UI_OPERATION_COUNT)
+
+    fields = ['title', 'author_name', 'price'] + custom_field_names(custom_field_count)
+    for export_format in EXPORTERS:
+        module_name = OPTIONAL_MODULES.get(export_format)
+        if module_name and importlib.util.find_spec(module_name) is None:
+            print(f"Skipping {export_format} export: {module_name} is not installed")
+            continue
+        path = os.path.join(output_dir, f"export.{export_format}")
+        bench.time(count, f"export_{export_format}",
+                   lambda: export_books(export_format, path, fields, db_handler=window.db_handler),
+                   items=window.db_handler.count_books())
+        os.remove(path)
+
+    def add_custom_field():
+        window.apply_custom_fields(window.custom_fields + [{"name": "Benchmark field", "required": False}])
+        app.processEvents()
+    bench.time(count, "add_custom_field", add_custom_field)
+
+    def remove_custom_field():
+        window.apply_custom_fields(window.custom_fields[:-1])
+        app.processEvents()
+    bench.time(count, "remove_custom_field", remove_custom_field)
+
+    def recreate_ui():
+        window.recreate_ui()
+        app.processEvents()
+    bench.time(count, "recreate_ui", recreate_ui)
+
+def compare(results, baseline_path):
+    """Print each operation's time relative to a baseline results file"""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {(result["books"], result["operation"]): result
+                    for result in json.load(file)["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        previous = baseline.get((result["books"], result["operation"]))
+        if previous is None or not previous["seconds"]:
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        regressions += bool(flag)
+        print(f"{result['books']:>9} books  {result['operation']:<22} {ratio:6.2f}x{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Book Management System headlessly.")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma-separated collection sizes (default: 10000,100000)")
+    parser.add_argument("--custom-fields", type=int, default=5,
+                        help="custom fields per book (default: 5)")
+    parser.add_argument("--mongo-uri", default="",
+                        help="MongoDB server to use instead of mongomock")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated books")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="where to write the JSON results (default: benchmark_results.json)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="results file from an earlier run to compare against")
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    if not args.mongo_uri:
+        use_mongomock()
+
+    scratch_dir = tempfile.mkdtemp(prefix="book_benchmark_")
+    app = QApplication(sys.argv)
+    isolate_settings(scratch_dir)
+    configure_settings(scratch_dir, args.custom_fields, args.mongo_uri)
+
+    bench = Benchmark()
+    window = None
+    try:
+        window = open_window(app)
+        if not window.database_online:
+            sys.exit("Could not connect to MongoDB")
+        # Sizes run smallest first, as peak RSS only ever grows within a process
+        for count in sizes:
+            run_size(app, window, bench, count, args.custom_fields, args.seed, scratch_dir)
+    finally:
+        if window is not None:
+            if window.db_handler is not None and window.db_handler.client is not None:
+                window.db_handler.client.drop_database(BENCHMARK_DATABASE_NAME)
+            window.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": "mongodb" if args.mongo_uri else "mongomock",
+        "custom_fields": args.custom_fields,
+        "seed": args.seed,
+        "results": bench.results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=4)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare and compare(bench.results, args.compare):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
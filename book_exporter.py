@@ -0,0 +1,200 @@
+import os
+import io
+import csv
+import gzip
+import json
+import itertools
+import metrics
+
+# Rows written between progress reports and cancellation checks
+PROGRESS_INTERVAL = 1000
+
+# Rows encoded and written together by the JSON Lines exporters
+JSONL_CHUNK_SIZE = 1000
+
+# Rows per Parquet row group and Arrow record batch; each is built and written
+# on its own, so memory use doesn't grow with the collection
+ROW_GROUP_SIZE = 65536
+
+# Modules needed by formats that rely on optional packages
+OPTIONAL_MODULES = {
+    'xlsx': 'openpyxl',
+    'jsonl.zst': 'zstandard',
+    'parquet': 'pyarrow',
+    'arrow': 'pyarrow',
+}
+
+class ExportCancelled(Exception):
+    """Raised inside an exporter when the user cancels"""
+
+def export_rows(books, fields, total, progress=None, cancelled=None):
+    """Yield each book as a row of the export fields, reporting progress as it goes"""
+    done = 0
+    for book in books:
+        yield {field: book.get(field, '') for field in fields}
+        done += 1
+        if done % PROGRESS_INTERVAL == 0:
+            if cancelled and cancelled():
+                raise ExportCancelled()
+            if progress:
+                progress(done, max(total, done))
+    if progress:
+        progress(done, max(total, done))
+
+def chunked(rows, size):
+    """Yield lists of up to size rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def export_to_csv(rows, file_path, fields):
+    """Write rows to a CSV file one at a time"""
+    with open(file_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def export_to_json(rows, file_path, fields):
+    """Write rows as a JSON array, one element at a time"""
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write('[')
+        separator = '\n'
+        for row in rows:
+            # Match json.dump(..., indent=4) output for a list of objects
+            element = json.dumps(row, indent=4).replace('\n', '\n    ')
+            file.write(f"{separator}    {element}")
+            separator = ',\n'
+        file.write('\n]' if separator != '\n' else ']')
+
+def write_jsonl(rows, file):
+    """Write rows as JSON Lines to an open text file, a chunk of lines at a time"""
+    for chunk in chunked(rows, JSONL_CHUNK_SIZE):
+        file.write(''.join(json.dumps(row) + '\n' for row in chunk))
+
+def export_to_jsonl(rows, file_path, fields):
+    """Write rows as JSON Lines, one object per line"""
+    with open(file_path, 'w', encoding='utf-8') as file:
+        write_jsonl(rows, file)
+
+def export_to_jsonl_gzip(rows, file_path, fields):
+    """Write rows as gzip-compressed JSON Lines"""
+    # Level 6 compresses nearly as well as 9 in a fraction of the time
+    with gzip.open(file_path, 'wt', encoding='utf-8', compresslevel=6) as file:
+        write_jsonl(rows, file)
+
+def export_to_jsonl_zstd(rows, file_path, fields):
+    """Write rows as Zstandard-compressed JSON Lines"""
+    import zstandard
+
+    with open(file_path, 'wb') as raw_file:
+        compressor = zstandard.ZstdCompressor(level=3)
+        with compressor.stream_writer(raw_file) as compressed:
+            file = io.TextIOWrapper(compressed, encoding='utf-8')
+            write_jsonl(rows, file)
+            file.flush()
+
+def arrow_schema(fields):
+    """Arrow schema for the export fields: price as a float, everything else as text"""
+    import pyarrow as pa
+
+    return pa.schema([(field, pa.float64() if field == 'price' else pa.string())
+                      for field in fields])
+
+def arrow_batches(rows, schema):
+    """Yield the rows as Arrow record batches of up to ROW_GROUP_SIZE rows"""
+    import pyarrow as pa
+
+    for chunk in chunked(rows, ROW_GROUP_SIZE):
+        columns = []
+        for field in schema:
+            values = [row[field.name] for row in chunk]
+            if field.name == 'price':
+                # Missing or unparseable prices become nulls
+                columns.append([price_or_none(value) for value in values])
+            else:
+                columns.append([None if value is None else str(value) for value in values])
+        yield pa.record_batch(columns, schema=schema)
+
+def price_or_none(value):
+    try:
+        return float(value) if value != '' else None
+    except (TypeError, ValueError):
+        return None
+
+def export_to_parquet(rows, file_path, fields):
+    """Write rows to a Parquet file, one row group per batch"""
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(fields)
+    with pq.ParquetWriter(file_path, schema, compression='zstd') as writer:
+        for batch in arrow_batches(rows, schema):
+            writer.write_batch(batch, row_group_size=ROW_GROUP_SIZE)
+
+def export_to_arrow(rows, file_path, fields):
+    """Write rows to an Arrow IPC (Feather v2) file, one record batch per chunk"""
+    import pyarrow as pa
+
+    schema = arrow_schema(fields)
+    with pa.OSFile(file_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for batch in arrow_batches(rows, schema):
+                writer.write_batch(batch)
+
+def export_to_excel(rows, file_path, fields):
+    """Write rows to an Excel file using openpyxl's streaming write-only mode"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(fields)
+    for row in rows:
+        sheet.append([row[field] for field in fields])
+    workbook.save(file_path)
+
+EXPORTERS = {
+    'csv': export_to_csv,
+    'json': export_to_json,
+    'jsonl': export_to_jsonl,
+    'jsonl.gz': export_to_jsonl_gzip,
+    'jsonl.zst': export_to_jsonl_zstd,
+    'xlsx': export_to_excel,
+    'parquet': export_to_parquet,
+    'arrow': export_to_arrow,
+}
+
+def export_books(export_format, file_path, fields, books=None, db_handler=None,
+                 progress=None, cancelled=None):
+    """Stream books to a file in the given format and return how many were written.
+
+    Books come from a database cursor when db_handler is given, otherwise from the
+    books iterable. A cancelled export removes its partial file and returns None.
+    """
+    if db_handler is not None:
+        total = db_handler.count_books()
+        # Transfer only the exported fields
+        books = db_handler.iter_books(fields=fields)
+    else:
+        books = list(books)
+        total = len(books)
+
+    written = 0
+    def counted(rows):
+        nonlocal written
+        for row in rows:
+            written += 1
+            yield row
+
+    try:
+        rows = counted(export_rows(books, fields, total, progress, cancelled))
+        with metrics.span(f"export.{export_format}"):
+            EXPORTERS[export_format](rows, file_path, fields)
+    except ExportCancelled:
+        metrics.increment("export.cancelled")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return None
+    metrics.increment("export.rows", written)
+    return written
@@ -0,0 +1,248 @@
+import csv
+import json
+from bson import ObjectId
+from book_keys import key_of
+
+# Records read and validated at a time
+IMPORT_CHUNK_SIZE = 5000
+
+# Characters read at a time from a JSON array file
+JSON_READ_SIZE = 1 << 20
+
+# Books written per insert_many call
+INSERT_BATCH_SIZE = 1000
+
+# Accepted column names (casefolded) for the standard fields
+STANDARD_FIELD_ALIASES = {
+    'title': 'title',
+    'author_name': 'author_name',
+    'author name': 'author_name',
+    'author': 'author_name',
+    'price': 'price',
+}
+
+def build_import_schema(title_required, author_required, price_required, custom_fields):
+    """Describe which fields an imported record may and must contain"""
+    return {
+        'required': {
+            'title': title_required,
+            'author_name': author_required,
+            'price': price_required,
+        },
+        'custom_fields': [{"name": field["name"], "required": field["required"]}
+                          for field in custom_fields],
+    }
+
+def count_records(file_path):
+    """Roughly count the records in a file, for progress reporting"""
+    if file_path.lower().endswith('.json'):
+        return 0  # Unknown until the array has been read through
+    lines = 0
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    # CSV files have a header line
+    if file_path.lower().endswith('.csv'):
+        lines -= 1
+    return max(lines, 0)
+
+def read_records(file_path):
+    """Yield (row number, record dict) from a CSV, JSON array or JSON Lines file"""
+    lower_path = file_path.lower()
+    if lower_path.endswith('.csv'):
+        with open(file_path, newline='', encoding='utf-8-sig') as file:
+            reader = csv.DictReader(file)
+            # Row numbers match a spreadsheet view, with the header on row 1
+            for row_number, record in enumerate(reader, start=2):
+                yield row_number, record
+    elif lower_path.endswith('.jsonl'):
+        with open(file_path, encoding='utf-8') as file:
+            for row_number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield row_number, json.loads(line)
+                    except ValueError as e:
+                        yield row_number, {'__error__': f"Invalid JSON: {e}"}
+    else:
+        with open(file_path, encoding='utf-8') as file:
+            yield from enumerate(iter_json_array(file), start=1)
+
+def iter_json_array(file):
+    """Yield the elements of the JSON array in a text file one at a time, holding
+    no more of the file in memory than the element being parsed"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    at_end = False
+
+    def read_more():
+        nonlocal buffer, position, at_end
+        block = file.read(JSON_READ_SIZE)
+        at_end = not block
+        buffer, position = buffer[position:] + block, 0
+
+    def skip_whitespace():
+        # Returns the next character, reading more of the file as needed, or '' at its end
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or at_end:
+                return buffer[position:position + 1]
+            read_more()
+
+    if skip_whitespace() != '[':
+        raise ValueError("JSON file must contain an array of books.")
+    position += 1
+    if skip_whitespace() == ']':
+        return
+    while True:
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except ValueError as e:
+            if at_end:
+                raise ValueError(f"Invalid JSON: {e}") from None
+            end = None
+        if end is not None:
+            # Numbers cut off by the end of the buffer parse short, so an element
+            # is only taken once the ',' or ']' after it has been read
+            while end < len(buffer) and buffer[end].isspace():
+                end += 1
+            separator = buffer[end:end + 1]
+            if separator in (',', ']') or at_end:
+                if separator not in (',', ']'):
+                    raise ValueError("Invalid JSON: expected ',' or ']' between books.")
+                position = end + 1
+                yield element
+                if separator == ']':
+                    return
+                skip_whitespace()
+                continue
+        read_more()
+
+def read_chunks(file_path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Group records from read_records into lists of up to chunk_size"""
+    chunk = []
+    for item in read_records(file_path):
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def validate_records(records, schema):
+    """Turn raw records into books, returning (row numbers, books, errors)"""
+    required = schema['required']
+    custom_fields = schema['custom_fields']
+    row_numbers = []
+    books = []
+    errors = []
+
+    for row_number, record in records:
+        if not isinstance(record, dict):
+            errors.append((row_number, "Record is not an object."))
+            continue
+        if '__error__' in record:
+            errors.append((row_number, record['__error__']))
+            continue
+
+        # Match columns case-insensitively
+        values = {}
+        for key, value in record.items():
+            if key is None:
+                continue  # Extra CSV cells without a header
+            key = str(key).strip().casefold()
+            values[STANDARD_FIELD_ALIASES.get(key, key)] = '' if value is None else value
+
+        title = str(values.get('title', '')).strip()
+        author_name = str(values.get('author_name', '')).strip()
+        price_text = str(values.get('price', '')).strip().lstrip('$')
+
+        row_errors = []
+        if required['title'] and not title:
+            row_errors.append("Title is required.")
+        if required['author_name'] and not author_name:
+            row_errors.append("Author Name is required.")
+        if required['price'] and not price_text:
+            row_errors.append("Price is required.")
+
+        price = 0.0
+        if price_text:
+            try:
+                price = float(price_text)
+                if price < 0:
+                    row_errors.append("Price cannot be negative.")
+            except ValueError:
+                row_errors.append(f"Invalid price '{price_text}'.")
+
+        book = {
+            'title': title,
+            'author_name': author_name,
+            'price': price
+        }
+        for field in custom_fields:
+            field_value = str(values.get(field["name"].casefold(), '')).strip()
+            if field["required"] and not field_value:
+                row_errors.append(f"{field['name']} is required.")
+            book[field["name"]] = field_value
+
+        if row_errors:
+            errors.append((row_number, " ".join(row_errors)))
+        else:
+            row_numbers.append(row_number)
+            books.append(book)
+
+    return row_numbers, books, errors
+
+def import_books(file_path, schema, db_handler, progress=None, cancelled=None):
+    """Read and validate a file a chunk at a time, writing it with batched insert_many calls.
+
+    Returns a dict with the number of books imported, a list of (row number,
+    message) errors and whether the import was cancelled. Books with the title
+    and author of a stored book, or of an earlier row, are skipped as errors.
+    """
+    total = count_records(file_path)
+    result = {"imported": 0, "errors": [], "cancelled": False}
+    processed = 0
+
+    def write(row_numbers, books):
+        # Claim each book's key up front, so duplicates are caught in O(1) before
+        # they're sent, including duplicates within the file
+        unique_rows, unique_books = [], []
+        for row_number, book in zip(row_numbers, books):
+            book['_id'] = str(ObjectId())
+            if db_handler.book_keys.claim(key_of(book), book['_id']):
+                unique_rows.append(row_number)
+                unique_books.append(book)
+            else:
+                result["errors"].append((row_number, "Duplicate of a book already in the collection."))
+
+        for start in range(0, len(unique_books), INSERT_BATCH_SIZE):
+            batch = unique_books[start:start + INSERT_BATCH_SIZE]
+            inserted, errors = db_handler.insert_books(batch)
+            result["imported"] += inserted
+            result["errors"].extend((unique_rows[start + index], message)
+                                    for index, message in errors)
+            db_handler.book_keys.discard([batch[index]['_id'] for index, _ in errors])
+
+    def handle(chunk_result, chunk_length):
+        nonlocal processed, total
+        row_numbers, books, errors = chunk_result
+        result["errors"].extend(errors)
+        write(row_numbers, books)
+        processed += chunk_length
+        if total:
+            total = max(total, processed)
+        if progress:
+            # A total of 0 shows as busy, for files that can't be counted up front
+            progress(processed, total)
+
+    # Only one chunk is held at a time, so memory stays flat on huge files
+    for chunk in read_chunks(file_path):
+        if cancelled and cancelled():
+            result["cancelled"] = True
+            break
+        handle(validate_records(chunk, schema), len(chunk))
+
+    return result
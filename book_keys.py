@@ -0,0 +1,65 @@
+import threading
+
+# Document field holding book_key(), backed by a unique index
+BOOK_KEY_FIELD = "title_author_key"
+
+def normalize(text):
+    """Casefold and collapse runs of whitespace, so near-identical spellings compare equal"""
+    return " ".join(str(text or "").casefold().split())
+
+def book_key(title, author_name):
+    """Key identifying a book by its normalized title and author"""
+    # A unit separator can't come from typing, so distinct pairs never collide
+    return normalize(title) + "\x1f" + normalize(author_name)
+
+def key_of(book):
+    return book_key(book.get('title', ''), book.get('author_name', ''))
+
+class BookKeyIndex:
+    """In-memory hash index of book keys, for O(1) duplicate checks.
+
+    Maps each key to the _id of the book holding it, and back, so books can be
+    dropped by _id. Shared between the GUI and worker threads, so every method
+    takes a lock.
+    """
+    def __init__(self):
+        self.ids_by_key = {}
+        self.keys_by_id = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids_by_key)
+
+    def claim(self, key, book_id):
+        """Record a book under its key unless another book holds it; returns
+        whether it was recorded"""
+        with self.lock:
+            holder = self.ids_by_key.get(key)
+            if holder is not None and holder != book_id:
+                return False
+            self.discard_locked(book_id)
+            self.ids_by_key[key] = book_id
+            self.keys_by_id[book_id] = key
+            return True
+
+    def add(self, key, book_id):
+        """Record a book under its key, e.g. one known to be stored already"""
+        with self.lock:
+            self.discard_locked(book_id)
+            self.ids_by_key[key] = book_id
+            self.keys_by_id[book_id] = key
+
+    def discard(self, book_ids):
+        with self.lock:
+            for book_id in book_ids:
+                self.discard_locked(book_id)
+
+    def discard_locked(self, book_id):
+        key = self.keys_by_id.pop(book_id, None)
+        if key is not None and self.ids_by_key.get(key) == book_id:
+            del self.ids_by_key[key]
+
+    def clear(self):
+        with self.lock:
+            self.ids_by_key.clear()
+            self.keys_by_id.clear()
@@ -1,56 +1,165 @@
 import os
-import csv
-import json
-import pandas as pd
+import itertools
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                            QPushButton, QLabel, QLineEdit, QTableWidget, QTableWidgetItem,
+                            QPushButton, QLabel, QLineEdit, QTableView,
                             QMessageBox, QGroupBox, QFormLayout, QHeaderView,
-                            QAbstractItemView, QMenuBar, QMenu, QAction, QApplication)
-from PyQt5.QtCore import Qt, QSettings, QTimer
-from settings_dialog import SettingsDialog
-from database_handler import DatabaseHandler
+                            QAbstractItemView, QMenuBar, QMenu, QAction, QApplication,
+                            QFileDialog, QComboBox)
+from PyQt5.QtCore import Qt, QTimer, QItemSelectionModel
+from PyQt5.QtGui import QKeySequence
+from db_worker import DatabaseWorker
+from app_settings import AppSettings
+from book_table_model import BookTableModel
+from book_record import BookRecord
+from book_keys import key_of
 from ui_components import (create_confirmation_dialog, get_dark_palette, 
-                         get_delete_button_style, ExportDialog, get_preferences_button_style)
+                         get_delete_button_style, ExportDialog, get_preferences_button_style,
+                         create_progress_dialog, update_progress_dialog)
 from about_dialog import AboutDialog
+import startup_trace
+import metrics
+
+# How long a removal can be undone for, in milliseconds
+UNDO_REMOVE_INTERVAL = 30000
+
+# How long to wait after the last cell edit before saving edits together, in milliseconds
+EDIT_SAVE_DELAY = 500
+
+# How long to wait after statistics go stale before recalculating them, in milliseconds
+STATS_REFRESH_DELAY = 1000
+
+# What the search bar reads when it's empty
+EMPTY_SEARCH_TERMS = {"text": "", "min_price": None, "max_price": None, "field_name": "", "field_value": ""}
 
 class BookManagementApp(QMainWindow):
     def __init__(self):
         super().__init__()
-        # Initialize settings
-        self.settings = QSettings("MyCompany", "BookManagementSystem")
+        # Initialize settings; the window reacts to changes through its signals
+        self.settings = AppSettings(parent=self)
         
-        # Initialize books list
+        # Initialize books list and the cursor that pages in the rest of it
         self.books = []
+        self.book_cursor = None
+        
+        # Current search bar filter, as keyword arguments for build_search_query;
+        # starts as what an empty search bar reads, so an unchanged one never requeries
+        self.search_terms = dict(EMPTY_SEARCH_TERMS)
+        
+        # Current (field name, direction) sort for database queries, or None for _id order
+        self.sort_spec = None
         
         # Initialize custom fields dictionary
         self.custom_fields = []
         self.load_custom_fields()
         
-        # Connect to database
-        self.db_handler = DatabaseHandler(self)
-        
-        # Load books from database
-        self.load_books_from_db()
+        # Round trips run on the worker's thread pool. The database modules pull in
+        # pymongo, so they're imported and connected once the window is showing
+        self.db_handler = None
+        self.db_worker = DatabaseWorker(None, self)
+        
+        # Books added but not yet saved, and those removed while their insert was in flight
+        self.pending_inserts = []
+        self.removed_while_pending = []
+        
+        # The last removal, kept until UNDO_REMOVE_INTERVAL passes so it can be undone
+        self.last_removal = None
+        self.undo_timer = QTimer(self)
+        self.undo_timer.setSingleShot(True)
+        self.undo_timer.setInterval(UNDO_REMOVE_INTERVAL)
+        self.undo_timer.timeout.connect(self.expire_undo_remove)
+        
+        # Cell edits not yet saved, by book _id: (book, {field: new value}, {field: old value});
+        # they're saved in one bulk write once editing pauses
+        self.pending_edits = {}
+        self.edit_timer = QTimer(self)
+        self.edit_timer.setSingleShot(True)
+        self.edit_timer.setInterval(EDIT_SAVE_DELAY)
+        self.edit_timer.timeout.connect(self.save_edits)
+        
+        # Writes are queued by the database handler and flushed to MongoDB together
+        # shortly after they're made; the interval is set once the database opens
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.flush_writes)
+        
+        # Collection statistics, computed on the server once and then kept current by
+        # applying each change made here; None until computed or once they go stale.
+        # The generation counts changes, so a result computed across one is discarded
+        self.collection_stats = None
+        self.stats_generation = 0
+        self.stats_computing = False
+        self.statistics_dialog = None
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setSingleShot(True)
+        self.stats_timer.setInterval(STATS_REFRESH_DELAY)
+        self.stats_timer.timeout.connect(self.compute_statistics)
+        # Ids of deletions already counted, so their echoes from sync are ignored
+        self.counted_deletions = set()
+        
+        # Watches for changes made on other workstations once books have loaded,
+        # by "change stream" or "polling", as shown in the connection tooltip
+        self.sync_worker = None
+        self.sync_mode = None
         
         # Initialize UI
         self.initUI()
+        self.connect_settings_signals()
+        
+        # Show connection status, then connect and probe the server without blocking
+        # startup; books load from MongoDB or the local store once the probe answers
+        self.create_status_bar()
+        QTimer.singleShot(0, self.open_database)
         
         # Apply theme based on settings after UI is initialized
         QTimer.singleShot(100, self.apply_theme)
+        
+        # Write metrics to disk periodically if metricsExportPath is set
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(15000)
+        self.metrics_timer.timeout.connect(self.write_metrics)
+        self.metrics_timer.start()
 
     def load_custom_fields(self):
         # Load saved custom fields from settings
-        self.custom_fields = []
-        size = self.settings.beginReadArray("customFields")
-        for i in range(size):
-            self.settings.setArrayIndex(i)
-            field_name = self.settings.value("name", "")
-            required = self.settings.value("required", False, type=bool)
-            self.custom_fields.append({"name": field_name, "required": required})
-        self.settings.endArray()
+        self.custom_fields = self.settings.custom_fields()
+    
+    def connect_settings_signals(self):
+        """Update the theme, required markers and columns when settings change"""
+        self.settings.dark_mode_changed.connect(self.apply_theme)
+        self.settings.required_fields_changed.connect(self.update_required_field_indicators)
+        self.settings.custom_fields_changed.connect(self.on_custom_fields_changed)
+    
+    def on_custom_fields_changed(self, custom_fields):
+        # Load the new fields with books from now on; books already loaded fetch
+        # them as their cells are shown
+        if self.db_handler is not None:
+            self.db_handler.set_projected_fields([field["name"] for field in custom_fields])
+        
+        # Add, remove and reorder custom field columns and inputs in place
+        self.apply_custom_fields(custom_fields)
+        
+        # Drop filters on removed fields
+        self.apply_search()
+        self.invalidate_statistics()
 
+    def open_database(self):
+        """Create the database handler and start probing the server"""
+        from database_handler import DatabaseHandler
+        self.db_handler = DatabaseHandler(self, self.settings)
+        self.db_worker.db_handler = self.db_handler
+        self.flush_timer.setInterval(self.db_handler.write_flush_interval)
+        # Load only the fields the table shows, leaving out ones from removed custom fields
+        self.db_handler.set_projected_fields([field["name"] for field in self.custom_fields])
+        startup_trace.mark("database client created")
+        self.check_connection()
+    
     def load_books_from_db(self):
-        self.books = self.db_handler.load_books()
+        from database_handler import build_search_query
+        # Opening the cursor doesn't touch the server; the table model fetches the
+        # first page in the background, and more as the user scrolls
+        self.books = []
+        self.book_cursor = self.db_handler.open_books_cursor(build_search_query(**self.search_terms),
+                                                             self.sort_spec)
 
     def initUI(self):
         # Set up the main window
@@ -104,6 +213,11 @@ class BookManagementApp(QMainWindow):
         add_book_group.setLayout(self.form_layout)
         left_layout.addWidget(add_book_group)
         
+        # Import button
+        import_button = QPushButton("Import")
+        import_button.clicked.connect(self.import_books)
+        left_layout.addWidget(import_button)
+        
         # Export button
         export_button = QPushButton("Export")
         export_button.clicked.connect(self.export_books)
@@ -122,11 +236,19 @@ class BookManagementApp(QMainWindow):
         right_panel = QWidget()
         right_layout = QVBoxLayout()
         
-        # Table for showing books
-        self.table = QTableWidget()
+        # Table for showing books, backed by a model over self.books
+        self.table = QTableView()
+        self.table_model = BookTableModel(self.books, self.custom_fields, self,
+                                          self.book_cursor, self.db_worker)
+        self.table_model.fetch_failed.connect(self.on_fetch_failed)
+        self.table_model.sort_requested.connect(self.on_sort_requested)
+        self.table_model.book_edited.connect(self.on_book_edited)
+        self.table_model.edit_rejected.connect(lambda message: self.statusBar().showMessage(message, 5000))
+        self.table.setModel(self.table_model)
         self.setup_table()
         
         right_layout.addWidget(QLabel("<h2>Book Collection</h2>"))
+        right_layout.addLayout(self.create_search_bar())
         right_layout.addWidget(self.table)
         
         # Add remove button at the bottom right underneath the book list
@@ -134,7 +256,7 @@ class BookManagementApp(QMainWindow):
         button_layout.addStretch()  # This pushes the button to the right
         
         # Create the remove button
-        self.remove_button = QPushButton("Remove Selected Book")
+        self.remove_button = QPushButton("Remove Selected")
         self.remove_button.clicked.connect(self.remove_selected_book)
         
         # Set the button style (red when enabled)
@@ -158,38 +280,329 @@ class BookManagementApp(QMainWindow):
         # Update required field indicators
         self.update_required_field_indicators()
         
-        # Update the table with books
+        # Update the table with books and start fetching the first page
         self.update_table()
+        self.table_model.fetchMore()
+        
+        # Connect table selection signal; the view's selection model exists once the model is set
+        self.connect_table_signals()
+    
+    def create_search_bar(self):
+        """Create the search and filter controls shown above the table"""
+        search_layout = QHBoxLayout()
+        
+        self.search_input = QLineEdit(self.search_terms.get("text", ""))
+        self.search_input.setPlaceholderText("Search title or author")
+        search_layout.addWidget(self.search_input, 3)
+        
+        self.min_price_input = QLineEdit()
+        self.min_price_input.setPlaceholderText("Min $")
+        self.max_price_input = QLineEdit()
+        self.max_price_input.setPlaceholderText("Max $")
+        for price_input, key in ((self.min_price_input, "min_price"), (self.max_price_input, "max_price")):
+            if self.search_terms.get(key) is not None:
+                price_input.setText(str(self.search_terms[key]))
+            price_input.setMaximumWidth(70)
+            search_layout.addWidget(price_input)
+        
+        # Exact match on one custom field
+        self.search_field_combo = QComboBox()
+        self.search_field_combo.addItem("Any field", "")
+        for field in self.custom_fields:
+            self.search_field_combo.addItem(field["name"], field["name"])
+        field_index = self.search_field_combo.findData(self.search_terms.get("field_name", ""))
+        self.search_field_combo.setCurrentIndex(max(field_index, 0))
+        search_layout.addWidget(self.search_field_combo)
+        
+        self.search_field_input = QLineEdit(self.search_terms.get("field_value", ""))
+        self.search_field_input.setPlaceholderText("Value")
+        search_layout.addWidget(self.search_field_input, 1)
+        
+        clear_button = QPushButton("Clear")
+        clear_button.clicked.connect(self.clear_search)
+        search_layout.addWidget(clear_button)
+        
+        # Wait for a pause in typing before querying the database
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.apply_search)
+        
+        for line_edit in (self.search_input, self.min_price_input,
+                          self.max_price_input, self.search_field_input):
+            line_edit.textChanged.connect(self.search_timer.start)
+            line_edit.returnPressed.connect(self.apply_search)
+        self.search_field_combo.currentIndexChanged.connect(self.search_timer.start)
+        
+        return search_layout
+    
+    def read_price_filter(self, price_input):
+        """Return the price typed into a filter box, or None if it's empty or invalid"""
+        try:
+            return float(price_input.text().strip().lstrip('$'))
+        except ValueError:
+            return None
+    
+    def apply_search(self):
+        """Run the search bar's query against the database, page by page"""
+        self.search_timer.stop()
+        search_terms = {
+            "text": self.search_input.text().strip(),
+            "min_price": self.read_price_filter(self.min_price_input),
+            "max_price": self.read_price_filter(self.max_price_input),
+            "field_name": self.search_field_combo.currentData() or "",
+            "field_value": self.search_field_input.text().strip(),
+        }
+        if search_terms == self.search_terms:
+            return
+        self.search_terms = search_terms
+        
+        if self.db_handler is None or not self.db_handler.has_storage():
+            self.statusBar().showMessage("Search needs a database connection.", 5000)
+            return
+        self.index_searched_fields()
+        self.reload_books()
+    
+    def clear_search(self):
+        for line_edit in (self.search_input, self.min_price_input,
+                          self.max_price_input, self.search_field_input):
+            line_edit.clear()
+        self.search_field_combo.setCurrentIndex(0)
+        self.apply_search()
+    
+    def create_status_bar(self):
+        """Create the status bar with a database connection indicator"""
+        self.connection_label = QLabel()
+        self.statusBar().addPermanentWidget(self.connection_label)
+        self.set_connection_status("Database: connecting...", "#999999")
+        # None until the first probe answers
+        self.database_online = None
+        
+        # Re-probe periodically while the database is unreachable
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setInterval(30000)
+        self.reconnect_timer.timeout.connect(self.check_connection)
+    
+    def set_connection_status(self, text, color, tooltip=""):
+        self.connection_label.setText(text)
+        self.connection_label.setStyleSheet(f"color: {color}; padding: 0 5px;")
+        self.connection_label.setToolTip(tooltip)
+    
+    def check_connection(self):
+        """Ping the database in the background and update the status indicator"""
+        if self.db_handler.client is None:
+            self.on_connection_failed("No MongoDB client")
+            return
+        self.db_worker.ping(on_finished=self.on_connection_ok,
+                            on_failed=self.on_connection_failed)
+    
+    def on_connection_ok(self, _):
+        startup_trace.mark("database probe answered")
+        self.set_connection_status("Database: connected", "#5cb85c", self.sync_mode_tooltip())
+        self.reconnect_timer.stop()
+        if self.database_online:
+            return
+        self.database_online = True
+        self.ensure_indexes()
+        # Push anything saved locally while offline, or queued before a crash,
+        # then load from MongoDB
+        self.db_worker.flush_writes(on_finished=self.on_sync_finished,
+                                    on_failed=self.on_sync_failed)
+    
+    def on_connection_failed(self, message):
+        startup_trace.mark("database probe answered")
+        if self.db_handler.local_store is not None:
+            self.set_connection_status("Database: offline - saving locally", "#d9534f", message)
+        else:
+            self.set_connection_status("Database: offline", "#d9534f", message)
+        if self.db_handler.client is not None:
+            self.reconnect_timer.start()
+        first_probe = self.database_online is None
+        if self.database_online is not False:
+            # Counts now come from the local store
+            self.invalidate_statistics()
+        self.database_online = False
+        if first_probe:
+            # Nothing loaded yet, so show what the local store has
+            self.reload_books()
+    
+    def check_still_online(self):
+        """Notice when a write fell back to the local store because MongoDB went away"""
+        if self.database_online and not self.db_handler.online:
+            self.on_connection_failed("Lost connection to MongoDB")
+    
+    def on_write_queued(self, _=None):
+        """Flush queued writes shortly, so ones made meanwhile go in the same bulk write"""
+        # Writing may have flushed earlier writes along the way
+        self.handle_rejected_writes()
+        self.check_still_online()
+        if self.database_online and not self.flush_timer.isActive():
+            self.flush_timer.start()
+    
+    def flush_writes(self):
+        self.db_worker.flush_writes(on_finished=self.on_writes_flushed,
+                                    on_failed=self.on_flush_failed)
+    
+    def on_writes_flushed(self, _=None):
+        self.handle_rejected_writes()
+        self.check_still_online()
+    
+    def on_flush_failed(self, message):
+        # Queued writes stay in the local store and are retried with the next flush,
+        # except books turned away as duplicates
+        self.handle_rejected_writes()
+        self.check_still_online()
+        if self.database_online:
+            self.statusBar().showMessage(f"Error saving changes to MongoDB: {message}", 5000)
+    
+    def on_sync_finished(self, synced):
+        self.handle_rejected_writes()
+        if synced:
+            self.statusBar().showMessage(f"Synced {synced} offline changes to MongoDB.", 5000)
+        self.reload_books()
+        self.start_sync_worker()
+        self.load_book_keys()
+        self.invalidate_statistics()
+    
+    def on_sync_failed(self, message):
+        self.handle_rejected_writes()
+        QMessageBox.warning(self, "Database Error", f"Error syncing offline changes: {message}")
+        self.reload_books()
+        self.start_sync_worker()
+        self.load_book_keys()
+        self.invalidate_statistics()
+    
+    def load_book_keys(self):
+        """Load every book's title and author key in the background, for duplicate checks"""
+        self.db_worker.submit(self.db_handler.load_book_keys,
+                              on_failed=lambda message: print(f"Error loading book keys: {message}"))
+    
+    def start_sync_worker(self):
+        """Start applying other workstations' changes as they happen, instead of reloading"""
+        if self.sync_worker is not None:
+            return
+        from book_sync import BookSyncWorker
+        self.sync_worker = BookSyncWorker(self.db_handler, self)
+        self.sync_worker.changes_received.connect(self.apply_remote_changes)
+        self.sync_worker.mode_changed.connect(self.on_sync_mode_changed)
+        self.sync_worker.start()
+    
+    def apply_remote_changes(self, changed_books, deleted_ids):
+        """Patch changed, added and deleted books into the table in place"""
+        for changed in changed_books:
+            self.db_handler.book_keys.add(key_of(changed), changed['_id'])
+        self.db_handler.book_keys.discard(deleted_ids)
+        
+        rows = {book['_id']: row for row, book in enumerate(self.books) if '_id' in book}
+        
+        new_books = []
+        stats_removed, stats_added = [], []
+        for changed in changed_books:
+            row = rows.get(changed['_id'])
+            if row is not None:
+                # Count the old copy out and the new one in; an echo of a change made here nets out
+                stats_removed.append(self.books[row].copy())
+                stats_added.append(changed)
+                # Update the existing dict, so pending operations holding it stay valid
+                self.books[row].clear()
+                self.books[row].update(changed)
+                self.books[row].loaded_fields = changed.loaded_fields
+                if changed['_id'] in self.pending_edits:
+                    # Edits made here since win until they're saved
+                    self.books[row].update(self.pending_edits[changed['_id']][1])
+                self.table_model.update_book_at(row)
+            elif changed['_id'] not in deleted_ids:
+                new_books.append(changed)
+        
+        # Remove from the bottom up so the remaining rows keep their numbers
+        for row in sorted((rows[book_id] for book_id in set(deleted_ids) if book_id in rows), reverse=True):
+            stats_removed.append(self.table_model.remove_book_at(row))
+        
+        # Books that aren't loaded can't be counted in or out without their old values
+        if any(changed['_id'] not in rows and changed['_id'] not in deleted_ids for changed in changed_books) or \
+           any(book_id not in rows and book_id not in self.counted_deletions for book_id in deleted_ids):
+            self.invalidate_statistics()
+        else:
+            self.update_statistics(added=stats_added, removed=stats_removed)
+        self.counted_deletions.update(deleted_ids)
+        
+        # New books only belong in the table when no filter might exclude them
+        if new_books and not any(self.search_terms.values()):
+            self.table_model.append_books(new_books)
+            if self.book_cursor is not None and not self.book_cursor.exhausted:
+                # Don't show them twice if the cursor later reaches them
+                self.book_cursor.skip_ids.update(book['_id'] for book in new_books)
         
-        # Connect table selection signal after initialization
-        QTimer.singleShot(100, self.connect_table_signals)
+        self.remove_button.setEnabled(len(self.table.selectionModel().selectedRows()) > 0)
+    
+    def on_sync_mode_changed(self, mode):
+        self.sync_mode = mode
+        if self.database_online:
+            self.connection_label.setToolTip(self.sync_mode_tooltip())
+    
+    def sync_mode_tooltip(self):
+        if self.sync_mode == "change stream":
+            return "Changes from other workstations arrive as they happen, through a change stream."
+        if self.sync_mode == "polling":
+            return f"Changes from other workstations are picked up by polling every {self.sync_worker.poll_interval} seconds."
+        return ""
+    
+    def ensure_indexes(self):
+        """Create the search indexes in the background"""
+        self.db_worker.ensure_indexes(
+            self.searched_field_names(),
+            on_failed=lambda message: print(f"Error creating indexes: {message}")
+        )
+    
+    def index_searched_fields(self):
+        """Index the custom fields now searched on or sorted by in the background"""
+        if not self.database_online:
+            return  # Indexed along with the rest once connected
+        self.db_worker.submit(
+            self.db_handler.ensure_field_indexes, self.searched_field_names(),
+            on_failed=lambda message: print(f"Error creating indexes: {message}")
+        )
+    
+    def searched_field_names(self):
+        """Return the custom fields the search bar filters on or the table is sorted by"""
+        used = {self.search_terms["field_name"], self.sort_spec[0] if self.sort_spec else None}
+        return [field["name"] for field in self.custom_fields if field["name"] in used]
+    
+    def reload_books(self):
+        """Reload the collection from a fresh cursor"""
+        self.load_books_from_db()
+        self.table_model.set_book_cursor(self.book_cursor, self.books)
+        self.remove_button.setEnabled(False)
+        self.table_model.fetchMore()
     
     def setup_table(self):
         """Set up the table structure based on standard and custom fields"""
-        # Calculate column count (title, author, price + custom fields)
-        column_count = 3 + len(self.custom_fields)
-        self.table.setColumnCount(column_count)
-        
-        # Create headers
-        headers = ["Title", "Author Name", "Price"]
-        headers.extend([field["name"] for field in self.custom_fields])
-        self.table.setHorizontalHeaderLabels(headers)
+        # Column count and headers come from the model (title, author, price + custom fields)
+        column_count = self.table_model.columnCount()
         
         # Set stretch for columns
         self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)  # Title
         self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)  # Author
         
         # Set fixed width for price column
-        if self.table.columnCount() > 2:
+        if column_count > 2:
             self.table.setColumnWidth(2, 100)  # Price column
         
         # Set remaining columns (custom fields) to reasonable widths
         for i in range(3, column_count):
             self.table.setColumnWidth(i, 150)
         
-        # Enable row selection
+        # Enable row selection; Ctrl and Shift select several books to remove at once
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        
+        # Sort by clicking a header; start unsorted, in the order books were added
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        
+        # Fixed row heights let the view skip measuring rows, keeping large collections smooth
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(24)
     
     def connect_table_signals(self):
         """Connect signals after initialization to ensure models exist"""
@@ -202,6 +615,10 @@ class BookManagementApp(QMainWindow):
         # File menu
         file_menu = menubar.addMenu('File')
         
+        import_action = QAction('Import', self)
+        import_action.triggered.connect(self.import_books)
+        file_menu.addAction(import_action)
+        
         export_action = QAction('Export', self)
         export_action.triggered.connect(self.export_books)
         file_menu.addAction(export_action)
@@ -210,6 +627,26 @@ class BookManagementApp(QMainWindow):
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
         
+        # Edit menu
+        edit_menu = menubar.addMenu('Edit')
+        
+        self.undo_remove_action = QAction('Undo Remove', self)
+        self.undo_remove_action.setShortcut(QKeySequence.Undo)
+        self.undo_remove_action.setEnabled(False)
+        self.undo_remove_action.triggered.connect(self.undo_remove)
+        edit_menu.addAction(self.undo_remove_action)
+        
+        find_duplicates_action = QAction('Find Duplicates...', self)
+        find_duplicates_action.triggered.connect(self.find_duplicates)
+        edit_menu.addAction(find_duplicates_action)
+        
+        # View menu
+        view_menu = menubar.addMenu('View')
+        
+        statistics_action = QAction('Statistics', self)
+        statistics_action.triggered.connect(self.show_statistics)
+        view_menu.addAction(statistics_action)
+        
         # Settings menu - Change to "Preferences"
         preferences_menu = menubar.addMenu('Preferences')
         
@@ -220,22 +657,73 @@ class BookManagementApp(QMainWindow):
         # Help menu
         help_menu = menubar.addMenu('Help')
         
+        diagnostics_action = QAction('Diagnostics', self)
+        diagnostics_action.triggered.connect(self.show_diagnostics)
+        help_menu.addAction(diagnostics_action)
+        
         about_action = QAction('About', self)
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
     
     def show_settings(self):
+        # Imports the database module for its defaults, so it's loaded on first use
+        from settings_dialog import SettingsDialog
+        # The window applies saved changes as the settings signal them
         settings_dialog = SettingsDialog(self, self.settings)
-        if settings_dialog.exec_():
-            # Reload custom fields
-            self.load_custom_fields()
-            
-            # Reinitialize UI to show updated custom fields
-            self.recreate_ui()
-            
-            # Update required field indicators
-            self.update_required_field_indicators()
+        settings_dialog.exec_()
+    
+    @metrics.timed("ui.apply_custom_fields")
+    def apply_custom_fields(self, custom_fields):
+        """Update the table columns, form rows and search field list for changed custom fields"""
+        old_names = [field["name"] for field in self.custom_fields]
+        selected_rows = [index.row() for index in self.table.selectionModel().selectedRows()]
+        # Updates self.custom_fields in place, since the model shares the list
+        self.table_model.set_custom_fields(custom_fields)
+        
+        # Inserted columns aren't part of the selection, so extend it to whole rows again
+        selection_model = self.table.selectionModel()
+        for row in selected_rows:
+            selection_model.select(self.table_model.index(row, 0),
+                                   QItemSelectionModel.Select | QItemSelectionModel.Rows)
+        
+        # Give new columns the usual custom field width
+        for column, field in enumerate(self.custom_fields, start=3):
+            if field["name"] not in old_names:
+                self.table.setColumnWidth(column, 150)
+        
+        # Remove form rows for deleted fields; removeRow deletes their widgets
+        new_names = [field["name"] for field in self.custom_fields]
+        for field_name in old_names:
+            if field_name not in new_names:
+                self.form_layout.removeRow(self.custom_field_inputs.pop(field_name))
+                del self.custom_field_labels[field_name]
+        
+        # Custom field rows follow the three standard ones, in field order
+        for row, field in enumerate(self.custom_fields, start=3):
+            field_name = field["name"]
+            input_field = self.custom_field_inputs.get(field_name)
+            if input_field is None:
+                input_field = QLineEdit()
+                label = QLabel(f"{field_name}:")
+                self.custom_field_inputs[field_name] = input_field
+                self.custom_field_labels[field_name] = label
+                self.form_layout.insertRow(row, label, input_field)
+            elif self.form_layout.getWidgetPosition(input_field)[0] != row:
+                current_row = self.form_layout.getWidgetPosition(input_field)[0]
+                self.form_layout.takeRow(current_row)
+                self.form_layout.insertRow(row, self.custom_field_labels[field_name], input_field)
+        
+        # Offer the new field list for exact-match search, keeping the selection if it still exists
+        selected_field = self.search_field_combo.currentData()
+        self.search_field_combo.blockSignals(True)
+        while self.search_field_combo.count() > 1:
+            self.search_field_combo.removeItem(1)
+        for field_name in new_names:
+            self.search_field_combo.addItem(field_name, field_name)
+        self.search_field_combo.setCurrentIndex(max(self.search_field_combo.findData(selected_field), 0))
+        self.search_field_combo.blockSignals(False)
     
+    @metrics.timed("ui.recreate_ui")
     def recreate_ui(self):
         """Recreate the UI to reflect changes in custom fields"""
         # Store current central widget to delete later
@@ -250,9 +738,9 @@ class BookManagementApp(QMainWindow):
     
     def update_required_field_indicators(self):
         """Update field labels to indicate required fields with asterisks"""
-        title_required = self.settings.value("titleRequired", True, type=bool)
-        author_required = self.settings.value("authorRequired", False, type=bool)
-        price_required = self.settings.value("priceRequired", False, type=bool)
+        title_required = self.settings.title_required
+        author_required = self.settings.author_required
+        price_required = self.settings.price_required
         
         # Update the labels directly
         self.title_label.setText("Title:" + (" *" if title_required else ""))
@@ -265,9 +753,18 @@ class BookManagementApp(QMainWindow):
                 label = self.custom_field_labels[field["name"]]
                 label.setText(f"{field['name']}:" + (" *" if field["required"] else ""))
         
-    def apply_theme(self):
-        """Apply dark or light theme based on settings"""
-        dark_mode = self.settings.value("darkMode", False, type=bool)
+        # Required cells can't be cleared by editing them in the table either
+        required_fields = {field_name for field_name, required in
+                           (("title", title_required), ("author_name", author_required),
+                            ("price", price_required)) if required}
+        required_fields.update(field["name"] for field in self.custom_fields if field["required"])
+        self.table_model.required_fields = required_fields
+        
+    @metrics.timed("ui.apply_theme")
+    def apply_theme(self, dark_mode=None):
+        """Apply dark or light theme based on settings, or preview the given one"""
+        if dark_mode is None:
+            dark_mode = self.settings.dark_mode
         
         if dark_mode:
             # Set dark theme
@@ -276,7 +773,7 @@ class BookManagementApp(QMainWindow):
             
             # Adjust table colors for better readability in dark mode
             self.table.setStyleSheet("""
-                QTableWidget {
+                QTableView {
                     background-color: #1e1e1e;
                     color: white;
                     gridline-color: #444;
@@ -286,7 +783,7 @@ class BookManagementApp(QMainWindow):
                     color: white;
                     border: 1px solid #444;
                 }
-                QTableWidget::item:selected {
+                QTableView::item:selected {
                     background-color: #0078d7;
                 }
             """)
@@ -325,9 +822,9 @@ class BookManagementApp(QMainWindow):
         price_text = self.price_input.text().strip()
         
         # Check required fields
-        title_required = self.settings.value("titleRequired", True, type=bool)
-        author_required = self.settings.value("authorRequired", False, type=bool)
-        price_required = self.settings.value("priceRequired", False, type=bool)
+        title_required = self.settings.title_required
+        author_required = self.settings.author_required
+        price_required = self.settings.price_required
         
         # Validate inputs based on required fields
         error_messages = []
@@ -368,11 +865,7 @@ class BookManagementApp(QMainWindow):
             price = 0.0  # Default price if not provided and not required
             
         # Create book entry
-        book = {
-            'title': title,
-            'author_name': author_name,
-            'price': price
-        }
+        book = BookRecord(title=title, author_name=author_name, price=price)
         
         # Add custom field values
         for field in self.custom_fields:
@@ -381,13 +874,30 @@ class BookManagementApp(QMainWindow):
                 field_value = self.custom_field_inputs[field_name].text().strip()
                 book[field_name] = field_value
         
-        # Add book to MongoDB and get ID
-        book_id = self.db_handler.add_book(book)
-        if book_id:
-            book['_id'] = book_id
+        from bson import ObjectId
+        # Assign the _id here, so changes echoed back by other workstations match this row
+        book['_id'] = str(ObjectId())
         
-        # Add book to list
-        self.books.append(book)
+        # Reject a second copy of a book; the inputs are kept so it can be corrected
+        if self.db_handler is not None and not self.db_handler.book_keys.claim(key_of(book), book['_id']):
+            QMessageBox.warning(self, "Duplicate Book",
+                                f"'{title}' by {author_name} is already in the collection.")
+            return
+        
+        # Add book to list right away, inserting just its row into the table
+        self.table_model.append_book(book)
+        self.update_statistics(added=[book])
+        if self.book_cursor is not None and not self.book_cursor.exhausted:
+            # Don't show the book twice if the cursor later reaches it
+            self.book_cursor.skip_ids.add(book['_id'])
+        
+        # Save to MongoDB in the background; the row is taken back out if that fails
+        self.pending_inserts.append(book)
+        self.db_worker.add_book(
+            book,
+            on_finished=lambda book_id: self.on_book_saved(book, book_id),
+            on_failed=lambda message: self.on_book_save_failed(book, message)
+        )
         
         # Clear inputs
         self.title_input.clear()
@@ -397,91 +907,421 @@ class BookManagementApp(QMainWindow):
         # Clear custom field inputs
         for input_field in self.custom_field_inputs.values():
             input_field.clear()
-        
-        # Update table
-        self.update_table()
     
     def remove_selected_book(self):
-        """Remove the selected book from the collection"""
-        selected_rows = self.table.selectionModel().selectedRows()
+        """Remove the selected books from the collection in one bulk delete"""
+        rows = sorted(index.row() for index in self.table.selectionModel().selectedRows()
+                      if 0 <= index.row() < len(self.books))
         
-        if not selected_rows:
+        if not rows:
             # This should not happen as button should be disabled, but keep as safeguard
             QMessageBox.warning(self, "Selection Error", "Please select a book to remove.")
             return
         
-        row_index = selected_rows[0].row()
-        if row_index < 0 or row_index >= len(self.books):
-            return
-            
-        book = self.books[row_index]
+        if len(rows) == 1:
+            book = self.books[rows[0]]
+            question = f"Are you sure you want to remove '{book['title']}' by {book['author_name']}?"
+        else:
+            question = f"Are you sure you want to remove these {len(rows)} books?"
         
         # Create custom confirmation dialog with red Yes button
-        dark_mode = self.settings.value("darkMode", False, type=bool)
-        msg_box = create_confirmation_dialog(
-            self, 
-            'Confirm Removal', 
-            f"Are you sure you want to remove '{book['title']}' by {book['author_name']}?",
-            dark_mode
-        )
+        dark_mode = self.settings.dark_mode
+        msg_box = create_confirmation_dialog(self, 'Confirm Removal', question, dark_mode)
         
         msg_box.exec_()
         
         # Check which button was clicked
-        if msg_box.clickedButton() == msg_box.buttons()[0]:  # Yes button is first
-            # Delete from database if available
-            if '_id' in book:
-                self.db_handler.remove_book(book['_id'])
-            
-            # Remove from local list
-            self.books.pop(row_index)
-            
-            # Update table
-            self.update_table()
-            
+        if msg_box.clickedButton() != msg_box.buttons()[0]:  # Yes button is first
+            return
+        
+        # Remove from local list, one row notification per contiguous range
+        removed = self.table_model.remove_rows(rows)
+        self.update_statistics(removed=[book for _, book in removed])
+        
+        book_ids = []
+        for _, book in removed:
+            if any(pending is book for pending in self.pending_inserts):
+                # Delete it once its insert has finished
+                self.removed_while_pending.append(book)
+            elif '_id' in book:
+                book_ids.append(book['_id'])
+        self.counted_deletions.update(book_ids)
+        
+        # Delete from database in one round trip; the rows are restored if that fails
+        # "stored" receives the books as they were stored, with fields the table didn't load
+        removal = {"removed": removed, "book_ids": book_ids, "deleting": bool(book_ids), "undone": False,
+                   "stored": {}}
+        if book_ids:
+            self.db_worker.remove_books(
+                list(book_ids),
+                on_finished=lambda books: self.on_books_removed(removal, books),
+                on_failed=lambda message: self.on_books_remove_failed(removal, message)
+            )
+        
+        # Keep the books for a while so the removal can be undone
+        self.last_removal = removal
+        self.undo_remove_action.setEnabled(True)
+        self.undo_timer.start()
+        
+        # The view moves the selection to a neighbouring row, if any
+        self.remove_button.setEnabled(len(self.table.selectionModel().selectedRows()) > 0)
+        
+        if len(removed) == 1:
             QMessageBox.information(self, "Success", "Book removed successfully!")
+        else:
+            QMessageBox.information(self, "Success", f"{len(removed)} books removed successfully!")
     
-    def update_table(self):
-        """Update the table with current book data"""
-        # Safely disconnect selection signal if connected
-        try:
-            if self.table.selectionModel():
-                self.table.selectionModel().selectionChanged.disconnect(self.on_selection_changed)
-        except TypeError:
-            # Signal wasn't connected, which is fine
-            pass
+    def on_books_removed(self, removal, stored_books):
+        removal["deleting"] = False
+        removal["stored"] = stored_books
+        self.on_write_queued()
+        if removal["undone"]:
+            # Undo was chosen while the delete was in flight
+            self.restore_removed_books(removal)
+    
+    def on_books_remove_failed(self, removal, message):
+        """Restore optimistically removed books"""
+        removal["deleting"] = False
+        if removal is self.last_removal:
+            self.expire_undo_remove()
+        if not removal["undone"]:
+            # Rows for books still waiting on their insert stay removed
+            restored = [(row, book) for row, book in removal["removed"]
+                        if book.get('_id') in removal["book_ids"]]
+            self.table_model.insert_books_at(restored)
+            self.update_statistics(added=[book for _, book in restored])
+        QMessageBox.warning(self, "Database Error", f"Error removing books: {message}")
+    
+    def undo_remove(self):
+        """Put the last removed books back, in the database and at their old rows"""
+        removal = self.last_removal
+        if removal is None:
+            return
+        self.expire_undo_remove()
+        removal["undone"] = True
+        
+        self.table_model.insert_books_at(removal["removed"])
+        self.update_statistics(added=[book for _, book in removal["removed"]])
+        for _, book in removal["removed"]:
+            if not self.take_pending_book(self.removed_while_pending, book) and \
+               book.get('_id') not in removal["book_ids"] and '_id' in book:
+                # Its insert finished after the removal, which then deleted it
+                removal["book_ids"].append(book['_id'])
+        
+        if not removal["deleting"]:
+            self.restore_removed_books(removal)
+        self.statusBar().showMessage("Removal undone.", 5000)
+    
+    def restore_removed_books(self, removal):
+        books = []
+        for _, book in removal["removed"]:
+            if book.get('_id') not in removal["book_ids"]:
+                continue
+            # Start from the stored copy, so fields the table never loaded come back too;
+            # the table's values are newer, e.g. edits not yet saved
+            restored = removal["stored"].get(book['_id'])
+            if restored is None:
+                restored = book
+            else:
+                restored.update(book)
+            books.append(restored)
+        if not books:
+            return
+        self.db_worker.restore_books(
+            books,
+            on_finished=lambda result: self.on_books_restored(books, result),
+            on_failed=lambda message: QMessageBox.warning(
+                self, "Database Error", f"Error restoring books: {message}")
+        )
+    
+    def on_books_restored(self, books, result):
+        """Take back out the rows of restored books that couldn't be put back, e.g.
+        because a book with the same title and author was added since"""
+        self.check_still_online()
+        _, errors = result
+        if not errors:
+            return
+        book_ids = {books[index]['_id'] for index, _ in errors}
+        removed = self.table_model.remove_rows(
+            [row for row, book in enumerate(self.books) if book.get('_id') in book_ids])
+        self.update_statistics(removed=[book for _, book in removed])
+        for book_id in book_ids:
+            self.pending_edits.pop(book_id, None)
+        self.remove_button.setEnabled(len(self.table.selectionModel().selectedRows()) > 0)
+        if len(book_ids) == 1:
+            book = books[errors[0][0]]
+            message = f"'{book['title']}' by {book['author_name']} couldn't be restored"
+        else:
+            message = f"{len(book_ids)} removed books couldn't be restored"
+        QMessageBox.warning(self, "Undo Remove", f"{message}: {errors[0][1]}")
+    
+    def expire_undo_remove(self):
+        """Forget the last removal once it can no longer be undone"""
+        self.last_removal = None
+        self.undo_timer.stop()
+        self.undo_remove_action.setEnabled(False)
+    
+    def handle_rejected_writes(self):
+        """Undo in the table the queued writes MongoDB turned away as duplicates"""
+        if self.db_handler is None:
+            return
+        self.remove_rejected_books()
+        self.reload_rejected_edits()
+    
+    def remove_rejected_books(self):
+        """Take out the rows of added books MongoDB turned away as duplicates, since
+        they were dropped from the write queue and aren't stored anywhere"""
+        book_ids = self.db_handler.take_rejected_inserts()
+        if not book_ids:
+            return
+        removed = self.table_model.remove_rows(
+            [row for row, book in enumerate(self.books) if book.get('_id') in book_ids])
+        self.update_statistics(removed=[book for _, book in removed])
+        for book_id in book_ids:
+            self.pending_edits.pop(book_id, None)
+        self.remove_button.setEnabled(len(self.table.selectionModel().selectedRows()) > 0)
+        if len(book_ids) == 1:
+            message = "An added book wasn't saved because another workstation had already saved"
+        else:
+            message = f"{len(book_ids)} added books weren't saved because another workstation had already saved"
+        QMessageBox.warning(self, "Duplicate Book", f"{message} a book with the same title and author.")
+    
+    def reload_rejected_edits(self):
+        """Put the stored values back into rows whose edits MongoDB turned away as
+        duplicates, since they were dropped from the write queue"""
+        book_ids = self.db_handler.take_rejected_updates()
+        if not book_ids:
+            return
+        self.db_worker.submit(
+            self.db_handler.find_books_by_id, list(book_ids),
+            on_finished=lambda books: self.apply_remote_changes(list(books.values()), []),
+            on_failed=lambda message: print(f"Error reloading books: {message}")
+        )
+        if len(book_ids) == 1:
+            message = "An edit wasn't saved because another workstation had already saved"
+        else:
+            message = f"Edits to {len(book_ids)} books weren't saved because another workstation had already saved"
+        QMessageBox.warning(self, "Duplicate Book", f"{message} a book with the same title and author.")
+    
+    def take_pending_book(self, books, book):
+        """Remove this exact book object from a pending list, returning whether it was there"""
+        for i, pending in enumerate(books):
+            if pending is book:
+                books.pop(i)
+                return True
+        return False
+    
+    def on_book_saved(self, book, book_id):
+        """Record the MongoDB _id of a book once its background insert finishes"""
+        self.take_pending_book(self.pending_inserts, book)
+        self.on_write_queued()
+        if not book_id:
+            return  # Running without a database
+        book['_id'] = book_id
+        
+        if self.take_pending_book(self.removed_while_pending, book):
+            self.counted_deletions.add(book_id)
+            self.db_worker.remove_book(book_id, on_finished=self.on_write_queued)
+    
+    def on_book_save_failed(self, book, message):
+        """Roll back an optimistically added book"""
+        self.take_pending_book(self.pending_inserts, book)
+        self.pending_edits.pop(book['_id'], None)
+        self.db_handler.book_keys.discard([book['_id']])
+        if not self.take_pending_book(self.removed_while_pending, book):
+            row = self.table_model.row_of(book)
+            if row >= 0:
+                self.table_model.remove_book_at(row)
+                self.update_statistics(removed=[book])
+        QMessageBox.warning(self, "Database Error", f"Error saving book: {message}")
+    
+    def on_book_edited(self, book, field_name, old_value, new_value):
+        """Queue an edited cell, saving once editing pauses"""
+        edited = {field_name: new_value}
+        if field_name in ('title', 'author_name'):
+            if self.db_handler is not None and not self.db_handler.book_keys.claim(key_of(book), book['_id']):
+                self.statusBar().showMessage(
+                    f"'{book['title']}' by {book['author_name']} is already in the collection.", 5000)
+                book[field_name] = old_value
+                self.table_model.update_book_at(self.table_model.row_of(book))
+                return
+            # Send both, so the duplicate check's key can be rebuilt from the update
+            edited = {'title': book['title'], 'author_name': book['author_name']}
+        self.edit_statistics(field_name, old_value, new_value)
+        
+        _, changes, old_values = self.pending_edits.setdefault(book['_id'], (book, {}, {}))
+        for name, value in edited.items():
+            changes[name] = value
+            # Keep the value from before the first unsaved edit, to roll back to
+            old_values.setdefault(name, old_value if name == field_name else value)
+        self.edit_timer.start()
+    
+    def save_edits(self):
+        """Save queued edits as $set updates of only the changed fields, in one bulk write"""
+        edits = []
+        for book_id, edit in list(self.pending_edits.items()):
+            # A book still being inserted is saved once the insert lands
+            if not any(pending is edit[0] for pending in self.pending_inserts):
+                edits.append(edit)
+                del self.pending_edits[book_id]
+        if self.pending_edits:
+            self.edit_timer.start()
+        if not edits:
+            return
         
-        self.table.setRowCount(0)  # Clear table
+        self.db_worker.update_books(
+            [(book['_id'], dict(changes)) for book, changes, _ in edits],
+            on_finished=self.on_write_queued,
+            on_failed=lambda message: self.on_edits_failed(edits, message)
+        )
+    
+    def on_edits_failed(self, edits, message):
+        """Roll back edited cells that couldn't be saved"""
+        for book, changes, old_values in edits:
+            for field_name, old_value in old_values.items():
+                # Leave fields edited again since alone; that edit is queued
+                if book.get(field_name) != changes[field_name]:
+                    continue
+                if old_value is None:
+                    del book[field_name]
+                else:
+                    book[field_name] = old_value
+            self.db_handler.book_keys.add(key_of(book), book['_id'])
+            row = self.table_model.row_of(book)
+            if row >= 0:
+                self.table_model.update_book_at(row)
+        self.invalidate_statistics()
+        QMessageBox.warning(self, "Database Error", f"Error saving changes: {message}")
+    
+    def find_duplicates(self):
+        """Look for books sharing a title and author, offering to merge them"""
+        if self.db_handler is None or not self.db_handler.is_online():
+            QMessageBox.warning(self, "Find Duplicates", "Finding duplicates needs a connection to MongoDB.")
+            return
+        self.statusBar().showMessage("Looking for duplicate books...")
+        self.db_worker.submit(
+            self.db_handler.find_duplicate_groups,
+            on_finished=self.on_duplicates_found,
+            on_failed=lambda message: QMessageBox.warning(
+                self, "Database Error", f"Error finding duplicates: {message}")
+        )
+    
+    def on_duplicates_found(self, groups):
+        self.statusBar().clearMessage()
+        if not groups:
+            QMessageBox.information(self, "Find Duplicates", "No duplicate books found.")
+            return
         
-        for book in self.books:
-            row_position = self.table.rowCount()
-            self.table.insertRow(row_position)
-            
-            # Add standard fields
-            self.table.setItem(row_position, 0, QTableWidgetItem(book.get('title', '')))
-            self.table.setItem(row_position, 1, QTableWidgetItem(book.get('author_name', '')))
-            self.table.setItem(row_position, 2, QTableWidgetItem(f"${book.get('price', 0):.2f}"))
-            
-            # Add custom fields
-            for col_idx, field in enumerate(self.custom_fields, start=3):
-                field_name = field["name"]
-                value = book.get(field_name, '')
-                self.table.setItem(row_position, col_idx, QTableWidgetItem(str(value)))
+        copies = sum(len(group) - 1 for group in groups)
+        msg_box = create_confirmation_dialog(
+            self,
+            'Merge Duplicates',
+            f"Found {len(groups)} books with {copies} duplicate copies. Merge each into its "
+            "oldest copy, keeping fields only the others have filled in, and remove the rest?",
+            self.settings.dark_mode
+        )
+        msg_box.setDetailedText("\n".join(
+            f"{len(group)} x '{group[0]['title']}' by {group[0]['author_name']}" for group in groups))
+        msg_box.exec_()
+        if msg_box.clickedButton() != msg_box.buttons()[0]:  # Yes button is first
+            return
         
-        # Reconnect the selection signal
-        QTimer.singleShot(0, self.connect_table_signals)
+        self.db_worker.submit(
+            self.db_handler.merge_duplicates, groups,
+            on_finished=self.on_duplicates_merged,
+            on_failed=lambda message: QMessageBox.warning(
+                self, "Database Error", f"Error merging duplicates: {message}")
+        )
+    
+    def on_duplicates_merged(self, removed):
+        self.reload_books()
+        self.invalidate_statistics()
+        QMessageBox.information(self, "Merge Duplicates", f"Removed {removed} duplicate books.")
+    
+    def on_sort_requested(self, field_name, order):
+        """Remember the sort and, while pages remain, requery in that order"""
+        direction = 1 if order == Qt.AscendingOrder else -1  # pymongo.ASCENDING / DESCENDING
+        self.sort_spec = (field_name, direction)
+        self.index_searched_fields()
+        if self.table_model.canFetchMore():
+            self.reload_books()
+    
+    def on_fetch_failed(self, message):
+        QMessageBox.warning(self, "Database Error", f"Error loading books: {message}")
+    
+    @metrics.timed("ui.update_table")
+    def update_table(self):
+        """Reload the table from the full book list"""
+        # The model formats cells on demand, so only the view needs to be told to reload
+        self.table_model.set_books(self.books)
         
         # Ensure the remove button is properly disabled if no row is selected
         self.remove_button.setEnabled(False)
             
+    def import_books(self):
+        """Import books from a CSV, JSON or JSON Lines file in the background"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Import Books", "",
+            "Book Files (*.csv *.json *.jsonl);;CSV Files (*.csv);;JSON Files (*.json *.jsonl);;All Files (*)"
+        )
+        if not file_path:
+            return
+        
+        # Loaded on first use, keeping the importer out of startup
+        from book_importer import build_import_schema, import_books
+        schema = build_import_schema(
+            self.settings.title_required,
+            self.settings.author_required,
+            self.settings.price_required,
+            self.custom_fields
+        )
+        
+        progress_dialog = create_progress_dialog(self, "Import", "Importing books...")
+        task = self.db_worker.submit(
+            import_books, file_path, schema, self.db_handler,
+            on_finished=lambda result: self.on_import_finished(progress_dialog, result),
+            on_failed=lambda message: self.on_import_failed(progress_dialog, message),
+            on_progress=lambda done, total: update_progress_dialog(progress_dialog, done, total)
+        )
+        progress_dialog.canceled.connect(task.cancel)
+        progress_dialog.show()
+    
+    def on_import_finished(self, progress_dialog, result):
+        progress_dialog.close()
+        self.check_still_online()
+        self.reload_books()
+        self.invalidate_statistics()
+        
+        summary = f"Imported {result['imported']} books."
+        if result["cancelled"]:
+            summary = "Import cancelled. " + summary
+        if result["errors"]:
+            summary += f"\n{len(result['errors'])} rows were skipped."
+        
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle("Import")
+        msg_box.setIcon(QMessageBox.Warning if result["errors"] else QMessageBox.Information)
+        msg_box.setText(summary)
+        if result["errors"]:
+            msg_box.setDetailedText("\n".join(f"Row {row}: {message}"
+                                              for row, message in sorted(result["errors"])))
+        msg_box.exec_()
+    
+    def on_import_failed(self, progress_dialog, message):
+        progress_dialog.close()
+        QMessageBox.critical(self, "Import Error", f"Error importing books: {message}")
+        # Some batches may have been written before the failure
+        self.reload_books()
+        self.invalidate_statistics()
+    
     def export_books(self):
-        """Export the book collection"""
-        if not self.books:
+        """Export the book collection in the background, streaming it to disk"""
+        if not self.books and not self.table_model.canFetchMore():
             QMessageBox.information(self, "Export", "No books to export.")
             return
             
         # Show export options dialog
-        dark_mode = self.settings.value("darkMode", False, type=bool)
+        dark_mode = self.settings.dark_mode
         export_dialog = ExportDialog(self, dark_mode)
         if not export_dialog.exec_():
             return  # User canceled
@@ -493,72 +1333,180 @@ class BookManagementApp(QMainWindow):
         if not file_path:
             return
         
-        try:
-            # All book fields except MongoDB ID
-            export_fields = ['title', 'author_name', 'price']
-            export_fields.extend([field["name"] for field in self.custom_fields])
-            
-            if export_format == 'csv':
-                self.export_to_csv(file_path, export_fields)
-            elif export_format == 'json':
-                self.export_to_json(file_path, export_fields)
-            else:  # xlsx
-                self.export_to_excel(file_path, export_fields)
-            
-            QMessageBox.information(
-                self, "Export Successful", 
-                f"Successfully exported {len(self.books)} books to:\n{os.path.abspath(file_path)}"
-            )
-        except Exception as e:
-            QMessageBox.critical(self, "Export Error", f"Error exporting books: {str(e)}")
-    
-    def export_to_csv(self, file_path, fields):
-        """Export the book collection to a CSV file"""
-        with open(file_path, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=fields)
-            writer.writeheader()
-            
-            # Write each book but exclude _id field
-            for book in self.books:
-                row = {}
-                for field in fields:
-                    row[field] = book.get(field, '')
-                writer.writerow(row)
-    
-    def export_to_json(self, file_path, fields):
-        """Export the book collection to a JSON file"""
-        export_data = []
-        
-        for book in self.books:
-            book_data = {}
-            for field in fields:
-                book_data[field] = book.get(field, '')
-            export_data.append(book_data)
-            
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(export_data, file, indent=4)
-    
-    def export_to_excel(self, file_path, fields):
-        """Export the book collection to an Excel file"""
-        # Create a dataframe with all books
-        data = []
-        for book in self.books:
-            row = {}
-            for field in fields:
-                row[field] = book.get(field, '')
-            data.append(row)
-            
-        df = pd.DataFrame(data)
-        df.to_excel(file_path, index=False)
+        # All book fields except MongoDB ID
+        export_fields = ['title', 'author_name', 'price']
+        export_fields.extend([field["name"] for field in self.custom_fields])
+        
+        # Stream from MongoDB when it's reachable, otherwise from a snapshot of the table
+        if self.db_handler is not None and self.db_handler.is_online():
+            self.start_export(export_format, file_path, export_fields, db_handler=self.db_handler)
+            return
+        self.table_model.fetch_all()
+        # Books loaded before a field was added need its values first
+        self.statusBar().showMessage("Loading books for export...")
+        self.table_model.load_fields(
+            export_fields, lambda: self.export_loaded_books(export_format, file_path, export_fields))
+    
+    def export_loaded_books(self, export_format, file_path, export_fields):
+        """Export a snapshot of the table once the fields to export have loaded"""
+        self.statusBar().clearMessage()
+        incomplete = sum(1 for book in self.books
+                         if not all(book.has_loaded(field_name) for field_name in export_fields))
+        if incomplete:
+            QMessageBox.warning(self, "Export",
+                                f"{incomplete} books loaded before going offline are missing "
+                                "values of newly added fields, which will be exported empty.")
+        self.start_export(export_format, file_path, export_fields, books=list(self.books))
+    
+    def start_export(self, export_format, file_path, export_fields, **source):
+        """Export from source, the db_handler or books keyword for export_books, in the background"""
+        # Loaded on first use, keeping the exporters out of startup
+        from book_exporter import export_books
+        
+        progress_dialog = create_progress_dialog(self, "Export", "Exporting books...")
+        task = self.db_worker.submit(
+            lambda progress, cancelled: export_books(export_format, file_path, export_fields,
+                                                     progress=progress, cancelled=cancelled,
+                                                     **source),
+            on_finished=lambda count: self.on_export_finished(progress_dialog, file_path, count),
+            on_failed=lambda message: self.on_export_failed(progress_dialog, message),
+            on_progress=lambda done, total: update_progress_dialog(progress_dialog, done, total)
+        )
+        progress_dialog.canceled.connect(task.cancel)
+        progress_dialog.show()
+    
+    def on_export_finished(self, progress_dialog, file_path, count):
+        progress_dialog.close()
+        if count is None:
+            return  # Cancelled
+        QMessageBox.information(
+            self, "Export Successful", 
+            f"Successfully exported {count} books to:\n{os.path.abspath(file_path)}"
+        )
+    
+    def on_export_failed(self, progress_dialog, message):
+        progress_dialog.close()
+        QMessageBox.critical(self, "Export Error", f"Error exporting books: {message}")
             
+    def show_statistics(self):
+        """Show collection statistics, computing them first if they aren't cached"""
+        if self.statistics_dialog is None:
+            from statistics_dialog import StatisticsDialog
+            self.statistics_dialog = StatisticsDialog(self)
+        self.statistics_dialog.show()
+        self.statistics_dialog.raise_()
+        if self.collection_stats is None:
+            self.compute_statistics()
+        else:
+            self.show_statistics_in_dialog()
+    
+    def compute_statistics(self):
+        """Compute the statistics from scratch in the background"""
+        self.stats_timer.stop()
+        if self.db_handler is None or self.stats_computing:
+            return
+        self.stats_computing = True
+        if self.statistics_dialog is not None:
+            self.statistics_dialog.set_loading()
+        generation = self.stats_generation
+        self.db_worker.submit(
+            self.db_handler.collection_stats, [field["name"] for field in self.custom_fields],
+            on_finished=lambda stats: self.on_statistics_computed(stats, generation),
+            on_failed=self.on_statistics_failed
+        )
+    
+    def on_statistics_computed(self, stats, generation):
+        self.stats_computing = False
+        if generation != self.stats_generation:
+            # Something changed while they were computed, which they may or may not include
+            self.compute_statistics()
+            return
+        self.collection_stats = stats
+        self.show_statistics_in_dialog()
+    
+    def on_statistics_failed(self, message):
+        self.stats_computing = False
+        if self.statistics_dialog is not None and self.statistics_dialog.isVisible():
+            QMessageBox.warning(self, "Database Error", f"Error computing statistics: {message}")
+    
+    def show_statistics_in_dialog(self):
+        if self.statistics_dialog is not None and self.collection_stats is not None:
+            self.statistics_dialog.set_stats(self.collection_stats, not self.db_handler.is_online())
+    
+    def update_statistics(self, added=(), removed=()):
+        """Count books added and removed here into the cached statistics"""
+        self.stats_generation += 1
+        if self.collection_stats is None:
+            return
+        if any(not book.has_loaded(field_name) for book in itertools.chain(added, removed)
+               for field_name in self.collection_stats.field_names):
+            # Books whose custom field values aren't loaded can't be counted in or out
+            self.invalidate_statistics()
+            return
+        for book in removed:
+            self.collection_stats.remove(book)
+        for book in added:
+            self.collection_stats.add(book)
+        self.show_statistics_in_dialog()
+    
+    def edit_statistics(self, field_name, old_value, new_value):
+        """Apply an edited cell to the cached statistics"""
+        self.stats_generation += 1
+        if self.collection_stats is None:
+            return
+        self.collection_stats.edit(field_name, old_value, new_value)
+        self.show_statistics_in_dialog()
+    
+    def invalidate_statistics(self):
+        """Drop the cached statistics after a change that can't be applied as a delta,
+        recalculating shortly if they're on screen"""
+        self.stats_generation += 1
+        self.collection_stats = None
+        if self.statistics_dialog is not None and self.statistics_dialog.isVisible():
+            self.statistics_dialog.set_loading()
+            self.stats_timer.start()
+    
+    def show_diagnostics(self):
+        """Show timings and counters collected while the application runs"""
+        from diagnostics_dialog import DiagnosticsDialog
+        diagnostics_dialog = DiagnosticsDialog(self)
+        diagnostics_dialog.exec_()
+    
+    def write_metrics(self):
+        """Write metrics to the file named by the metricsExportPath setting, for scraping"""
+        file_path = self.settings.value("metricsExportPath", "")
+        if not file_path:
+            return
+        try:
+            metrics.registry.write(file_path)
+        except OSError as e:
+            print(f"Error writing metrics to {file_path}: {e}")
+    
     def show_about(self):
         """Show information about the application"""
-        dark_mode = self.settings.value("darkMode", False, type=bool)
+        dark_mode = self.settings.dark_mode
         about_dialog = AboutDialog(self, dark_mode)
         about_dialog.exec_()
     
     def closeEvent(self, event):
         """Handle application close event"""
-        # Close MongoDB connection
-        self.db_handler.close_connection()
+        # Stop watching for changes and let background writes finish,
+        # then close any open books cursor and the MongoDB connection
+        if self.sync_worker is not None:
+            self.sync_worker.stop()
+        self.db_worker.wait_for_done()
+        # Save edits still waiting, including those to books whose insert just landed
+        self.save_edits()
+        self.db_worker.wait_for_done()
+        # Send queued writes now; any that can't be sent stay in the local store until next time
+        if self.db_handler is not None:
+            try:
+                self.db_handler.flush_writes()
+            except Exception as e:
+                print(f"Error flushing writes: {e}")
+        if self.book_cursor is not None:
+            self.book_cursor.close()
+        if self.db_handler is not None:
+            self.db_handler.close_connection()
+        self.write_metrics()
         event.accept()
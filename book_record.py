@@ -0,0 +1,148 @@
+import sys
+from collections.abc import MutableMapping
+
+# Custom field name tuples shared by every record with the same fields, and
+# likewise loaded field sets
+_field_layouts = {}
+
+def shared_field_names(field_names):
+    """Return one shared, interned tuple for a sequence of custom field names"""
+    field_names = tuple(sys.intern(str(name)) for name in field_names)
+    return _field_layouts.setdefault(field_names, field_names)
+
+def compact_value(value):
+    """Intern short strings, which repeat across books (authors, genres and so on)"""
+    if type(value) is str and len(value) <= 64:
+        return sys.intern(value)
+    return value
+
+class BookRecord(MutableMapping):
+    """A book held in memory, readable and writable like the book dicts it replaces.
+
+    The standard fields live in slots and custom field values in a tuple, with
+    the custom field names in a tuple shared by every book that has the same
+    fields. A book costs a fraction of a dict with the same keys, which matters
+    with hundreds of thousands of books loaded. '_id' is only present once set.
+
+    A book fetched with a projection keeps the projected field names, shared by
+    the books fetched together, in loaded_fields; None means every field was
+    fetched. Other fields may hold values that haven't been loaded yet.
+    """
+    __slots__ = ('_id', 'title', 'author_name', 'price', 'field_names', 'field_values',
+                 'loaded_fields')
+
+    STANDARD_FIELDS = ('title', 'author_name', 'price')
+
+    def __init__(self, book=(), **fields):
+        self._id = None
+        self.title = ''
+        self.author_name = ''
+        self.price = 0.0
+        self.field_names = ()
+        self.field_values = ()
+        self.loaded_fields = None
+        self.update(book, **fields)
+
+    def update(self, book=(), **fields):
+        """Set several fields, rebuilding the custom field tuples only once"""
+        items = list(book.items() if hasattr(book, 'items') else book) + list(fields.items())
+        custom = dict(zip(self.field_names, self.field_values))
+        for key, value in items:
+            if key == '_id':
+                self._id = value
+            elif key == 'title' or key == 'author_name':
+                setattr(self, key, '' if value is None else compact_value(value))
+            elif key == 'price':
+                self.price = value
+            else:
+                custom[key] = compact_value(value)
+        if len(custom) != len(self.field_names) or any(
+                name not in custom for name in self.field_names):
+            self.field_names = shared_field_names(custom)
+        self.field_values = tuple(custom[name] for name in self.field_names)
+
+    def __getitem__(self, key):
+        if key == '_id':
+            if self._id is None:
+                raise KeyError(key)
+            return self._id
+        if key in self.STANDARD_FIELDS:
+            return getattr(self, key)
+        try:
+            return self.field_values[self.field_names.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        self.update(((key, value),))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key == '_id':
+            self._id = None
+        elif key in self.STANDARD_FIELDS:
+            setattr(self, key, 0.0 if key == 'price' else '')
+        else:
+            index = self.field_names.index(key)
+            self.field_values = self.field_values[:index] + self.field_values[index + 1:]
+            self.field_names = shared_field_names(
+                self.field_names[:index] + self.field_names[index + 1:])
+
+    def __contains__(self, key):
+        if key == '_id':
+            return self._id is not None
+        return key in self.STANDARD_FIELDS or key in self.field_names
+
+    def __iter__(self):
+        if self._id is not None:
+            yield '_id'
+        yield from self.STANDARD_FIELDS
+        yield from self.field_names
+
+    def __len__(self):
+        return (self._id is not None) + len(self.STANDARD_FIELDS) + len(self.field_names)
+
+    def get(self, key, default=None):
+        # Called for every table cell, so avoid the KeyError round trip
+        if key == 'title':
+            return self.title
+        if key == 'author_name':
+            return self.author_name
+        if key == 'price':
+            return self.price
+        if key in self:
+            return self[key]
+        return default
+
+    def clear(self):
+        self._id = None
+        self.title = ''
+        self.author_name = ''
+        self.price = 0.0
+        self.field_names = ()
+        self.field_values = ()
+        self.loaded_fields = None
+
+    def has_loaded(self, key):
+        """Whether the value of key is known, rather than left out when the book was fetched"""
+        return self.loaded_fields is None or key in self.loaded_fields or key in self
+
+    def mark_loaded(self, keys):
+        """Record that the values of keys have been fetched"""
+        if self.loaded_fields is not None:
+            loaded_fields = self.loaded_fields | frozenset(keys)
+            # Books fetched together end up with the same set, so share one
+            self.loaded_fields = _field_layouts.setdefault(loaded_fields, loaded_fields)
+
+    def copy(self):
+        book = BookRecord(self)
+        book.loaded_fields = self.loaded_fields
+        return book
+
+    def to_dict(self):
+        """Return the book as a plain dict"""
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"BookRecord({self.to_dict()!r})"
@@ -0,0 +1,61 @@
+from collections import Counter
+
+def price_of(book):
+    try:
+        return float(book.get('price') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def is_filled(value):
+    return value is not None and value != ''
+
+class CollectionStats:
+    """Totals over the whole collection.
+
+    Computed once by aggregation, then kept current by applying each add,
+    removal and edit as a delta, so they never need a rescan.
+    """
+    def __init__(self, field_names, count=0, total_price=0.0, authors=None, filled=None):
+        self.field_names = list(field_names)
+        self.count = count
+        self.total_price = total_price
+        # Books per author, and books with each custom field filled in
+        self.authors = Counter(authors or {})
+        self.filled = Counter(filled or {})
+
+    @property
+    def average_price(self):
+        return self.total_price / self.count if self.count else 0.0
+
+    def fill_rate(self, field_name):
+        return self.filled[field_name] / self.count if self.count else 0.0
+
+    def top_authors(self, limit):
+        return self.authors.most_common(limit)
+
+    def add(self, book, sign=1):
+        """Count a book in, or out with sign=-1"""
+        self.count += sign
+        self.total_price += sign * price_of(book)
+        self.count_author(book.get('author_name', ''), sign)
+        for field_name in self.field_names:
+            if is_filled(book.get(field_name)):
+                self.filled[field_name] += sign
+
+    def remove(self, book):
+        self.add(book, -1)
+
+    def edit(self, field_name, old_value, new_value):
+        """Apply one edited field of a book"""
+        if field_name == 'price':
+            self.total_price += price_of({'price': new_value}) - price_of({'price': old_value})
+        elif field_name == 'author_name':
+            self.count_author(old_value or '', -1)
+            self.count_author(new_value or '', 1)
+        elif field_name in self.field_names:
+            self.filled[field_name] += is_filled(new_value) - is_filled(old_value)
+
+    def count_author(self, author_name, sign):
+        self.authors[author_name] += sign
+        if self.authors[author_name] <= 0:
+            del self.authors[author_name]
@@ -0,0 +1,111 @@
+import threading
+from datetime import timedelta
+from pymongo.errors import OperationFailure
+from PyQt5.QtCore import QThread, pyqtSignal
+from database_handler import book_from_document
+
+# Seconds between polls when change streams aren't available
+DEFAULT_POLL_INTERVAL = 5
+
+# Overlap between polls, covering workstation clocks that run behind the server's
+CLOCK_SKEW_ALLOWANCE = timedelta(seconds=30)
+
+class BookSyncWorker(QThread):
+    """Watches the books collection for changes made elsewhere.
+
+    Uses a change stream when the server is a replica set (a single-node one
+    is enough), and otherwise polls the indexed updated_at field and the
+    deleted_books collection from a watermark. Changes are delivered in
+    batches through changes_received; applying them must be idempotent,
+    since polling windows overlap.
+    """
+    # (changed or inserted books, deleted _ids)
+    changes_received = pyqtSignal(list, list)
+    # "change stream" or "polling"
+    mode_changed = pyqtSignal(str)
+
+    def __init__(self, db_handler, parent=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(parent)
+        self.db_handler = db_handler
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.resume_token = None
+        self.watermark = None
+        # Set once the server turns out not to support change streams
+        self.use_polling = False
+        self.mode = None
+
+    def stop(self):
+        self.stop_event.set()
+        self.wait()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if not self.db_handler.is_online():
+                self.stop_event.wait(self.poll_interval)
+                continue
+            try:
+                if self.watermark is None:
+                    # Start from now; the table was just loaded
+                    self.watermark = self.db_handler.server_info()["localTime"]
+                if not self.use_polling and self.db_handler.server_info().get("setName"):
+                    self.set_mode("change stream")
+                    self.watch()
+                else:
+                    self.set_mode("polling")
+                    self.poll()
+            except OperationFailure as e:
+                if self.use_polling:
+                    print(f"Error syncing books: {e}")
+                    self.stop_event.wait(self.poll_interval)
+                else:
+                    print(f"Change stream unavailable, polling instead: {e}")
+                    self.use_polling = True
+            except Exception as e:
+                # Keep retrying; the thread must outlive transient database errors
+                print(f"Error syncing books: {e}")
+                self.stop_event.wait(self.poll_interval)
+
+    def set_mode(self, mode):
+        if mode != self.mode:
+            self.mode = mode
+            self.mode_changed.emit(mode)
+
+    def watch(self):
+        collection = self.db_handler.books_collection
+        loaded_fields = self.db_handler.projected_fields
+        pipeline = []
+        if loaded_fields is not None:
+            # Deliver only the fields the table shows; the event's _id is its resume token
+            projection = {"operationType": 1, "documentKey": 1, "fullDocument._id": 1}
+            projection.update((f"fullDocument.{field}", 1) for field in loaded_fields)
+            pipeline.append({"$project": projection})
+        with collection.watch(pipeline, full_document="updateLookup", resume_after=self.resume_token,
+                              max_await_time_ms=1000) as stream:
+            changed, deleted = [], []
+            # Reopen with a new projection when custom fields change, resuming where this left off
+            while not self.stop_event.is_set() and self.db_handler.projected_fields == loaded_fields:
+                change = stream.try_next()
+                if change is not None:
+                    self.resume_token = stream.resume_token
+                    operation = change["operationType"]
+                    if operation == "delete":
+                        deleted.append(str(change["documentKey"]["_id"]))
+                    elif change.get("fullDocument") is not None:
+                        changed.append(book_from_document(change["fullDocument"], loaded_fields))
+                    continue
+                # Nothing more waiting; hand over what has built up
+                if changed or deleted:
+                    self.changes_received.emit(changed, deleted)
+                    changed, deleted = [], []
+            if changed or deleted:
+                self.changes_received.emit(changed, deleted)
+
+    def poll(self):
+        while not self.stop_event.is_set() and self.db_handler.is_online():
+            poll_started = self.db_handler.server_info()["localTime"]
+            changed, deleted = self.db_handler.changes_since(self.watermark - CLOCK_SKEW_ALLOWANCE)
+            self.watermark = poll_started
+            if changed or deleted:
+                self.changes_received.emit(changed, deleted)
+            self.stop_event.wait(self.poll_interval)
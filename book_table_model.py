@@ -0,0 +1,421 @@
+import itertools
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant, QTimer, pyqtSignal
+
+# Standard columns shown before any custom fields: (header, book key)
+STANDARD_COLUMNS = [("Title", "title"), ("Author Name", "author_name"), ("Price", "price")]
+
+# Most books whose missing fields are fetched in one round trip
+FIELD_FETCH_BATCH_SIZE = 500
+
+def sort_key(book, field_name):
+    """Client-side sort key: numeric for price, casefolded text for everything else"""
+    value = book.get(field_name, '')
+    if field_name == "price":
+        try:
+            return float(value or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    return str(value).casefold()
+
+def fetch_fields_in_batches(db_handler, book_ids, field_names):
+    """Fetch fields for many books, FIELD_FETCH_BATCH_SIZE per round trip, as
+    {_id: {field: value}}; runs on a DatabaseWorker thread"""
+    values = {}
+    for start in range(0, len(book_ids), FIELD_FETCH_BATCH_SIZE):
+        values.update(db_handler.fetch_fields(book_ids[start:start + FIELD_FETCH_BATCH_SIZE], field_names))
+    return values
+
+class BookTableModel(QAbstractTableModel):
+    """Table model backed directly by the book list, formatting cells on demand"""
+    # Emitted with an error message when a page of books fails to load
+    fetch_failed = pyqtSignal(str)
+    # Emitted with (field name, Qt.SortOrder) on every sort; while pages remain to be
+    # fetched, the owner is expected to requery the database in that order
+    sort_requested = pyqtSignal(str, int)
+    # Emitted with (book, field name, old value, new value) after a cell is edited;
+    # the old value is None if the book didn't have the field
+    book_edited = pyqtSignal(object, str, object, object)
+    # Emitted with a message when an edited value is rejected
+    edit_rejected = pyqtSignal(str)
+
+    def __init__(self, books, custom_fields, parent=None, book_cursor=None, db_worker=None):
+        super().__init__(parent)
+        self.books = books
+        self.custom_fields = custom_fields
+        # Optional BookCursor supplying further pages as the view scrolls
+        self.book_cursor = book_cursor
+        # Optional DatabaseWorker that fetches pages off the GUI thread
+        self.db_worker = db_worker
+        self.fetching = False
+        # Book keys whose cells can't be edited to empty
+        self.required_fields = set()
+        # Shown books loaded without some custom fields' values, by _id, e.g. ones
+        # loaded before a field was added; fetched in batches as cells need them
+        self.books_missing_fields = {}
+        self.fetching_fields = False
+        self.field_fetch_timer = QTimer(self)
+        self.field_fetch_timer.setSingleShot(True)
+        self.field_fetch_timer.timeout.connect(self.fetch_missing_fields)
+        # Counts sorts, so one waiting on its field values is dropped if another follows
+        self.sort_generation = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.books)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(STANDARD_COLUMNS) + len(self.custom_fields)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.book_cursor is None:
+            return False
+        return not self.book_cursor.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.book_cursor is None or self.fetching:
+            return
+        book_cursor = self.book_cursor
+        if self.db_worker is None:
+            self.append_fetched(book_cursor, book_cursor.fetch(book_cursor.batch_size))
+            return
+        # Only one fetch may use the cursor at a time
+        self.fetching = True
+        self.db_worker.fetch_books(book_cursor, book_cursor.batch_size,
+                                   on_finished=lambda books: self.append_fetched(book_cursor, books),
+                                   on_failed=lambda message: self.on_fetch_failed(book_cursor, message))
+
+    def append_fetched(self, book_cursor, books):
+        """Append a page of books fetched from book_cursor"""
+        if book_cursor is not self.book_cursor:
+            # The cursor was replaced while this page was in flight
+            book_cursor.close()
+            return
+        self.fetching = False
+        self.append_books(books)
+
+    def on_fetch_failed(self, book_cursor, message):
+        if book_cursor is not self.book_cursor:
+            return
+        self.fetching = False
+        self.fetch_failed.emit(message)
+
+    def set_book_cursor(self, book_cursor, books):
+        """Show books from a new cursor, e.g. for a new search"""
+        old_cursor = self.book_cursor
+        if old_cursor is not None and not self.fetching:
+            old_cursor.close()
+        # A page still in flight from the old cursor closes it when it lands
+        self.book_cursor = book_cursor
+        self.fetching = False
+        self.set_books(books)
+
+    def fetch_all(self):
+        """Fetch every remaining page, e.g. before operating on the whole collection"""
+        if self.db_worker is not None:
+            # Let any page already in flight land first so rows stay in order
+            self.db_worker.wait_for_done()
+        while self.canFetchMore():
+            try:
+                self.append_fetched(self.book_cursor, self.book_cursor.fetch(self.book_cursor.batch_size))
+            except Exception as e:
+                self.on_fetch_failed(self.book_cursor, str(e))
+
+    def set_custom_fields(self, custom_fields):
+        """Add, remove and reorder custom field columns in place to match custom_fields.
+
+        Only the affected columns are announced to views, so the rest of the table,
+        its selection and its column widths are left alone.
+        """
+        base = len(STANDARD_COLUMNS)
+        new_names = [field["name"] for field in custom_fields]
+
+        # Drop columns for removed fields, from the right so earlier indexes stay valid
+        for index in reversed(range(len(self.custom_fields))):
+            if self.custom_fields[index]["name"] not in new_names:
+                self.beginRemoveColumns(QModelIndex(), base + index, base + index)
+                del self.custom_fields[index]
+                self.endRemoveColumns()
+
+        # Walk the new order, moving existing columns into place and inserting new ones
+        for index, field in enumerate(custom_fields):
+            current_names = [current["name"] for current in self.custom_fields]
+            if index < len(current_names) and current_names[index] == field["name"]:
+                self.custom_fields[index] = dict(field)
+            elif field["name"] in current_names:
+                source = current_names.index(field["name"])
+                self.beginMoveColumns(QModelIndex(), base + source, base + source,
+                                      QModelIndex(), base + index)
+                self.custom_fields.pop(source)
+                self.custom_fields.insert(index, dict(field))
+                self.endMoveColumns()
+            else:
+                self.beginInsertColumns(QModelIndex(), base + index, base + index)
+                self.custom_fields.insert(index, dict(field))
+                self.endInsertColumns()
+
+    def field_for_column(self, column):
+        """Return the book key displayed in the given column"""
+        if column < len(STANDARD_COLUMNS):
+            return STANDARD_COLUMNS[column][1]
+        return self.custom_fields[column - len(STANDARD_COLUMNS)]["name"]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return QVariant()
+
+        book = self.books[index.row()]
+        field_name = self.field_for_column(index.column())
+
+        if not book.has_loaded(field_name):
+            # Shown empty until its value arrives
+            self.request_fields(book)
+            return ''
+        if field_name == "price":
+            if role == Qt.EditRole:
+                return f"{book.get('price', 0):.2f}"
+            return f"${book.get('price', 0):.2f}"
+        return str(book.get(field_name, ''))
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if not self.books[index.row()].has_loaded(self.field_for_column(index.column())):
+            # Editing needs the current value, to compare against and roll back to
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        """Validate and apply an edited cell, then announce it through book_edited"""
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        book = self.books[index.row()]
+        field_name = self.field_for_column(index.column())
+        text = str(value).strip()
+
+        if not text and field_name in self.required_fields:
+            self.edit_rejected.emit(f"{self.headerData(index.column(), Qt.Horizontal)} is required.")
+            return False
+        if field_name == "price":
+            try:
+                # An empty price is 0, as when adding a book
+                new_value = float(text.lstrip('$') or 0)
+            except ValueError:
+                self.edit_rejected.emit("Please enter a valid price.")
+                return False
+            if new_value < 0:
+                self.edit_rejected.emit("Price cannot be negative.")
+                return False
+        else:
+            new_value = text
+
+        old_value = book.get(field_name)
+        if old_value == new_value:
+            return True
+        book[field_name] = new_value
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        self.book_edited.emit(book, field_name, old_value, new_value)
+        return True
+
+    def request_fields(self, book):
+        """Fetch the fields a shown book was loaded without, together with other such books"""
+        if self.db_worker is None:
+            return
+        self.books_missing_fields[book['_id']] = book
+        if not self.fetching_fields and not self.field_fetch_timer.isActive():
+            self.field_fetch_timer.start()
+
+    def missing_field_names(self, books):
+        return sorted({field["name"] for field in self.custom_fields for book in books
+                       if not book.has_loaded(field["name"])})
+
+    def fetch_missing_fields(self):
+        """Fetch the next batch of requested fields in the background"""
+        if self.fetching_fields or not self.books_missing_fields:
+            return
+        book_ids = list(itertools.islice(self.books_missing_fields, FIELD_FETCH_BATCH_SIZE))
+        books = [self.books_missing_fields.pop(book_id) for book_id in book_ids]
+        field_names = self.missing_field_names(books)
+        if not field_names:
+            # Their fields were removed or arrived some other way meanwhile
+            self.fetch_missing_fields()
+            return
+        self.fetching_fields = True
+        self.db_worker.fetch_fields(book_ids, field_names,
+                                    on_finished=lambda values: self.on_fields_fetched(books, field_names, values),
+                                    on_failed=self.on_fetch_fields_failed)
+
+    def on_fields_fetched(self, books, field_names, values):
+        self.fetching_fields = False
+        self.set_fetched_fields(books, field_names, values)
+        self.fetch_missing_fields()
+
+    def on_fetch_fields_failed(self, message):
+        # The books are requested again the next time their cells are drawn
+        self.fetching_fields = False
+        print(f"Error loading book fields: {message}")
+
+    def set_fetched_fields(self, books, field_names, values):
+        for book in books:
+            fetched = values.get(book['_id'])
+            if fetched is None:
+                # Not where it was looked for, e.g. a MongoDB book while offline
+                continue
+            book.update((name, value) for name, value in fetched.items() if not book.has_loaded(name))
+            book.mark_loaded(field_names)
+        # Views only repaint the cells they show, so announcing every row is cheap
+        if self.books:
+            self.dataChanged.emit(self.index(0, len(STANDARD_COLUMNS)),
+                                  self.index(len(self.books) - 1, self.columnCount() - 1))
+
+    def load_fields(self, field_names, on_loaded):
+        """Fetch the given fields for every book loaded without them in the background,
+        then call on_loaded(); straight away if no book is missing them.
+
+        If the fetch fails, fetch_failed is emitted and on_loaded() is still called.
+        """
+        books = [book for book in self.books
+                 if any(not book.has_loaded(name) for name in field_names)]
+        if not books or self.db_worker is None:
+            on_loaded()
+            return
+
+        def on_finished(values):
+            self.set_fetched_fields(books, field_names, values)
+            on_loaded()
+
+        def on_failed(message):
+            self.fetch_failed.emit(message)
+            on_loaded()
+
+        self.db_worker.submit(fetch_fields_in_batches, self.db_worker.db_handler,
+                              [book['_id'] for book in books], field_names,
+                              on_finished=on_finished, on_failed=on_failed)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+
+        if orientation == Qt.Horizontal:
+            if section < len(STANDARD_COLUMNS):
+                return STANDARD_COLUMNS[section][0]
+            return self.custom_fields[section - len(STANDARD_COLUMNS)]["name"]
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort by a column, in the database while pages remain or in memory otherwise"""
+        if column < 0 or column >= self.columnCount():
+            return
+        field_name = self.field_for_column(column)
+        self.sort_generation += 1
+        
+        # Sorting only the loaded pages would be wrong, so let the database order the rest
+        needs_server_sort = self.canFetchMore()
+        self.sort_requested.emit(field_name, int(order))
+        if needs_server_sort:
+            return
+        # Books loaded before the field was added need its values to sort by
+        generation = self.sort_generation
+        self.load_fields([field_name], lambda: self.sort_loaded_books(field_name, order, generation))
+
+    def sort_loaded_books(self, field_name, order, generation):
+        """Sort the books in memory, unless another sort was asked for meanwhile"""
+        if generation != self.sort_generation:
+            return
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        old_books = [self.books[index.row()] for index in old_indexes]
+        
+        # Compute each key once rather than on every comparison
+        keys = [sort_key(book, field_name) for book in self.books]
+        rows = sorted(range(len(self.books)), key=keys.__getitem__,
+                      reverse=(order == Qt.DescendingOrder))
+        self.books[:] = [self.books[row] for row in rows]
+        
+        # Selection and other persistent indexes follow their books, not their old rows
+        new_rows = {id(book): row for row, book in enumerate(self.books)}
+        new_indexes = [self.index(new_rows[id(book)], index.column())
+                       for book, index in zip(old_books, old_indexes)]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def append_book(self, book):
+        """Append a book to the backing list, inserting a single row"""
+        row = len(self.books)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.books.append(book)
+        self.endInsertRows()
+
+    def append_books(self, books):
+        """Append several books at once, inserting their rows in one notification"""
+        if not books:
+            return
+        row = len(self.books)
+        self.beginInsertRows(QModelIndex(), row, row + len(books) - 1)
+        self.books.extend(books)
+        self.endInsertRows()
+
+    def update_book_at(self, row):
+        """Notify views that the book at the given row changed in place"""
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+    
+    def row_of(self, book):
+        """Return the row holding this exact book object, or -1"""
+        for row, candidate in enumerate(self.books):
+            if candidate is book:
+                return row
+        return -1
+
+    def remove_book_at(self, row):
+        """Remove and return the book at the given row, removing a single row"""
+        self.beginRemoveRows(QModelIndex(), row, row)
+        book = self.books.pop(row)
+        self.endRemoveRows()
+        return book
+
+    def remove_rows(self, rows):
+        """Remove the books at the given rows, one notification per contiguous range.
+
+        Returns (row, book) pairs in ascending row order, for insert_books_at.
+        """
+        removed = []
+        rows = sorted(set(rows), reverse=True)
+        index = 0
+        while index < len(rows):
+            # Collect a run of adjacent rows, working from the bottom so earlier rows stay put
+            last = first = rows[index]
+            index += 1
+            while index < len(rows) and rows[index] == first - 1:
+                first = rows[index]
+                index += 1
+            self.beginRemoveRows(QModelIndex(), first, last)
+            books = self.books[first:last + 1]
+            del self.books[first:last + 1]
+            self.endRemoveRows()
+            # Collected bottom up, then reversed once at the end
+            removed.extend(zip(range(last, first - 1, -1), reversed(books)))
+        removed.reverse()
+        return removed
+
+    def insert_books_at(self, removed):
+        """Put back (row, book) pairs returned by remove_rows at their old rows"""
+        index = 0
+        while index < len(removed):
+            # Working from the top, each run of adjacent rows goes back in one insert
+            first = removed[index][0]
+            end = index + 1
+            while end < len(removed) and removed[end][0] == removed[end - 1][0] + 1:
+                end += 1
+            first = min(first, len(self.books))
+            self.beginInsertRows(QModelIndex(), first, first + end - index - 1)
+            self.books[first:first] = [book for _, book in removed[index:end]]
+            self.endInsertRows()
+            index = end
+
+    def set_books(self, books):
+        """Replace the backing book list"""
+        self.beginResetModel()
+        self.books = books
+        self.endResetModel()
@@ -1,69 +1,830 @@
+import os
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timezone
 import pymongo
+from pymongo import InsertOne, UpdateOne, DeleteMany
+from pymongo.write_concern import WriteConcern
 from bson import ObjectId
+from book_record import BookRecord
+from book_keys import BOOK_KEY_FIELD, BookKeyIndex, key_of
+from book_stats import CollectionStats
+from pymongo.errors import BulkWriteError, ConnectionFailure, CursorNotFound, OperationFailure
 from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtCore import QStandardPaths
+from local_store import LocalBookStore
+import metrics
+
+# Number of books fetched per page when scrolling through the collection
+BOOKS_BATCH_SIZE = 100
+
+# Connection defaults, overridable through QSettings
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/"
+DEFAULT_DATABASE_NAME = "book_management"
+DEFAULT_MAX_POOL_SIZE = 100
+DEFAULT_MIN_POOL_SIZE = 0
+DEFAULT_SERVER_SELECTION_TIMEOUT_MS = 2000
+DEFAULT_CONNECT_TIMEOUT_MS = 2000
+DEFAULT_SOCKET_TIMEOUT_MS = 10000
+
+# Books sent per bulk_write when flushing queued writes
+SYNC_BATCH_SIZE = 1000
+
+# Write-behind defaults, overridable through QSettings: queued writes are flushed
+# this many milliseconds after they're made, or once this many books are queued
+DEFAULT_WRITE_FLUSH_INTERVAL_MS = 200
+DEFAULT_WRITE_BATCH_SIZE = 500
+# "w" write concern for flushes: a number of members, or "majority"
+DEFAULT_WRITE_CONCERN = "1"
+
+# How long deletions are remembered for workstations polling for changes
+DELETED_BOOKS_TTL_SECONDS = 7 * 24 * 3600
+
+def default_local_store_path():
+    data_dir = QStandardPaths.writableLocation(QStandardPaths.GenericDataLocation)
+    return os.path.join(data_dir, "MyCompany", "BookManagementSystem", "books.sqlite3")
+
+def book_from_document(document, loaded_fields=None):
+    """Convert a MongoDB document into a BookRecord with a string _id.
+    
+    loaded_fields names the fields the document was projected to, if any.
+    """
+    # Convert MongoDB _id to string representation for internal tracking
+    book = BookRecord(_id=str(document['_id']))
+    book.loaded_fields = loaded_fields
+    
+    # Add all fields from the book document, skipping the ObjectId as we've
+    # already converted it, and sync and duplicate-check bookkeeping
+    book.update((key, value) for key, value in document.items()
+                if key not in ('_id', 'updated_at', BOOK_KEY_FIELD))
+    return book
+
+def document_from_book(book):
+    """Build the document to write for a book, stamped for incremental sync
+    and with the key the unique index checks for duplicates"""
+    document = dict(book)
+    if '_id' in document:
+        document['_id'] = ObjectId(document['_id'])
+    document['updated_at'] = datetime.now(timezone.utc)
+    document[BOOK_KEY_FIELD] = key_of(book)
+    return document
+
+def update_from_changes(changes):
+    """Build the $set update for changed fields, stamped like document_from_book.
+    
+    The key is only restamped when changes hold both the title and the author.
+    """
+    fields = dict(changes, updated_at=datetime.now(timezone.utc))
+    if 'title' in changes and 'author_name' in changes:
+        fields[BOOK_KEY_FIELD] = key_of(changes)
+    return {"$set": fields}
+
+def is_duplicate_book_error(error):
+    """Whether a bulk write error is the unique title and author index rejecting a book"""
+    return (error.get('code') == 11000
+            and (BOOK_KEY_FIELD in error.get('keyPattern', {}) or BOOK_KEY_FIELD in error.get('errmsg', '')))
+
+def build_search_query(text="", min_price=None, max_price=None, field_name="", field_value=""):
+    """Build a MongoDB filter for the search bar; every part is backed by an index"""
+    query = {}
+    if text:
+        query["$text"] = {"$search": text}
+    if min_price is not None or max_price is not None:
+        price_range = {}
+        if min_price is not None:
+            price_range["$gte"] = min_price
+        if max_price is not None:
+            price_range["$lte"] = max_price
+        query["price"] = price_range
+    if field_name and field_value:
+        query[field_name] = field_value
+    return query
+
+class BookCursor:
+    """Pages through the books collection using a live cursor.
+    
+    Books come in _id order unless sort gives a (field, direction) to order by,
+    in which case _id breaks ties so the order is stable across pages.
+    """
+    def __init__(self, db_handler, query=None, sort=None, batch_size=BOOKS_BATCH_SIZE):
+        self.db_handler = db_handler
+        self.query = query or {}
+        self.sort = sort
+        self.batch_size = batch_size
+        self.last_id = None
+        self.fetched = 0
+        self.exhausted = False
+        # Books added locally while paging; skipped if the cursor reaches them
+        self.skip_ids = set()
+        # Fetch only the fields the table shows at the time the cursor opens
+        self.loaded_fields = db_handler.projected_fields
+        self.projection = db_handler.projection()
+        self.cursor = self.open_cursor()
+        
+    def open_cursor(self):
+        # Resume after the last book seen so a reopened cursor does not repeat rows
+        if self.sort is not None:
+            field_name, direction = self.sort
+            return (self.db_handler.books_collection.find(self.query, self.projection)
+                    .sort([(field_name, direction), ("_id", direction)])
+                    .skip(self.fetched)
+                    .batch_size(self.batch_size))
+        
+        query = dict(self.query)
+        if self.last_id is not None:
+            query["_id"] = {"$gt": self.last_id}
+        return (self.db_handler.books_collection.find(query, self.projection)
+                .sort("_id", pymongo.ASCENDING)
+                .batch_size(self.batch_size))
+        
+    @metrics.timed("database.fetch_page")
+    def fetch(self, count):
+        """Return up to count more books, marking the cursor exhausted at the end.
+        
+        Safe to call from a worker thread as long as only one fetch runs at a time.
+        """
+        books = []
+        while len(books) < count and not self.exhausted:
+            try:
+                document = next(self.cursor)
+            except StopIteration:
+                self.close()
+            except CursorNotFound:
+                # The server discarded an idle cursor; reopen from the last book seen
+                self.cursor = self.open_cursor()
+            except Exception:
+                # May run on a worker thread, so leave reporting the error to the caller
+                self.close()
+                raise
+            else:
+                self.last_id = document['_id']
+                self.fetched += 1
+                book = book_from_document(document, self.loaded_fields)
+                if book['_id'] not in self.skip_ids:
+                    books.append(book)
+        metrics.increment("database.books_fetched", len(books))
+        return books
+        
+    def close(self):
+        self.exhausted = True
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
 
 class DatabaseHandler:
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, settings=None):
         self.parent = parent
+        self.settings = settings
         self.client = None
         self.books_collection = None
+        # False once MongoDB is known to be unreachable; reads and writes then use the local store
+        self.online = False
+        self.local_store = None
+        # Adds, edits and removals are queued in the local store, which journals them
+        # to disk, and flushed to MongoDB in bulk; this keeps flushes and queueing apart
+        self.write_lock = threading.Lock()
+        self.write_flush_interval = self.setting("writeFlushInterval", DEFAULT_WRITE_FLUSH_INTERVAL_MS)
+        self.write_batch_size = self.setting("writeBatchSize", DEFAULT_WRITE_BATCH_SIZE)
+        self.write_concern = self.build_write_concern()
+        # Keys of the books stored, for duplicate checks; filled by load_book_keys
+        self.book_keys = BookKeyIndex()
+        # _ids of queued books MongoDB turned away as duplicates when flushed, for
+        # the window to take back out; see take_rejected_inserts
+        self.rejected_inserts = deque()
+        # Likewise for queued edits, for the window to reload; see take_rejected_updates
+        self.rejected_updates = deque()
+        # Fields loaded with books, as set by set_projected_fields; None loads every
+        # field, including ones left behind by removed custom fields
+        self.projected_fields = None
+        # Custom fields indexed so far, by ensure_field_indexes
+        self.indexed_fields = set()
+        self.open_local_store()
         self.connect_to_mongodb()
         
+    def open_local_store(self):
+        try:
+            self.local_store = LocalBookStore(self.setting("localStorePath", default_local_store_path()))
+        except Exception as e:
+            print(f"Error opening local store: {e}")
+            self.local_store = None
+            
+    def is_online(self):
+        return self.books_collection is not None and self.online
+        
+    def has_storage(self):
+        """Whether books persist anywhere, in MongoDB or the local store"""
+        return self.books_collection is not None or self.local_store is not None
+        
+    def storage(self):
+        """Return the backend reads and writes go to: self for MongoDB, or the local store"""
+        if (self.books_collection is None or not self.online) and self.local_store is not None:
+            return self.local_store
+        return self
+        
+    def setting(self, key, default):
+        """Read a connection setting, falling back to the default without QSettings"""
+        if self.settings is None:
+            return default
+        return self.settings.value(key, default, type=type(default))
+        
+    def build_write_concern(self):
+        w = str(self.setting("mongoWriteConcern", DEFAULT_WRITE_CONCERN)).strip()
+        return WriteConcern(w=int(w) if w.isdigit() else w)
+        
+    def connection_options(self):
+        """Build MongoClient keyword arguments from settings"""
+        options = {
+            "maxPoolSize": self.setting("mongoMaxPoolSize", DEFAULT_MAX_POOL_SIZE),
+            "minPoolSize": self.setting("mongoMinPoolSize", DEFAULT_MIN_POOL_SIZE),
+            "serverSelectionTimeoutMS": self.setting("mongoServerSelectionTimeoutMS",
+                                                     DEFAULT_SERVER_SELECTION_TIMEOUT_MS),
+            "connectTimeoutMS": self.setting("mongoConnectTimeoutMS", DEFAULT_CONNECT_TIMEOUT_MS),
+            "socketTimeoutMS": self.setting("mongoSocketTimeoutMS", DEFAULT_SOCKET_TIMEOUT_MS),
+        }
+        # Comma-separated list such as "zstd,snappy,zlib"; empty disables compression
+        compressors = self.setting("mongoCompressors", "")
+        if compressors:
+            options["compressors"] = compressors
+        return options
+        
     def connect_to_mongodb(self):
         try:
-            # Connect to MongoDB - update connection string as needed
-            self.client = pymongo.MongoClient("mongodb://localhost:27017/")
-            self.db = self.client["book_management"]
+            # MongoClient connects lazily, so this returns without waiting for the server;
+            # use ping() to find out whether it's actually reachable
+            uri = self.setting("mongoUri", DEFAULT_MONGO_URI)
+            self.client = pymongo.MongoClient(uri, **self.connection_options())
+            self.db = self.client[self.setting("mongoDatabase", DEFAULT_DATABASE_NAME)]
             self.books_collection = self.db["books"]
-            print("Connected to MongoDB successfully")
+            # Deleted _ids, so other workstations polling for changes can see deletions
+            self.deleted_collection = self.db["deleted_books"]
+            # Assume the server is up until an operation or ping() says otherwise
+            self.online = True
+            print(f"MongoDB client created for {uri}")
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
             if self.parent:
-                QMessageBox.critical(self.parent, "Database Error", 
-                                    f"Failed to connect to MongoDB: {str(e)}\n\nThe application will run without persistence.")
+                message = (f"Failed to connect to MongoDB: {str(e)}\n\n"
+                           + ("Books will be saved locally." if self.local_store is not None
+                              else "The application will run without persistence."))
+                QMessageBox.critical(self.parent, "Database Error", message)
             self.books_collection = None
             
-    def load_books(self):
-        books = []
-        if self.books_collection is not None:
+    @metrics.timed("database.ping")
+    def ping(self):
+        """Check that the server is reachable; raises if it isn't within the selection timeout"""
+        if self.client is None:
+            raise ConnectionError("No MongoDB client")
+        try:
+            self.client.admin.command("ping")
+        except Exception:
+            self.online = False
+            raise
+        self.online = True
+        return True
+        
+    @metrics.timed("database.flush_writes")
+    def flush_writes(self):
+        """Send the writes queued in the local store to MongoDB, one bulk_write per batch.
+        
+        Returns the number of books written; raises on database errors, leaving
+        whatever wasn't written queued for the next attempt.
+        """
+        if self.local_store is None or not self.is_online():
+            return 0
+        collection = self.books_collection.with_options(write_concern=self.write_concern)
+        flushed = 0
+        with self.write_lock:
+            while self.local_store.has_pending_changes():
+                books = self.local_store.pending_inserts(SYNC_BATCH_SIZE)
+                updates = self.local_store.pending_updates(SYNC_BATCH_SIZE - len(books))
+                book_ids = self.local_store.pending_deletes(SYNC_BATCH_SIZE - len(books) - len(updates))
+                
+                # Each book has at most one queued change, so the order doesn't matter
+                requests = [InsertOne(document_from_book(book)) for book in books]
+                requests += [UpdateOne({"_id": ObjectId(book_id)}, update_from_changes(changes))
+                             for book_id, changes in updates]
+                # The book _ids each request writes, to match up errors
+                request_ids = [[book['_id']] for book in books] + [[book_id] for book_id, _ in updates]
+                if book_ids:
+                    requests.append(DeleteMany({"_id": {"$in": [ObjectId(book_id) for book_id in book_ids]}}))
+                    request_ids.append(book_ids)
+                
+                failed_ids = set()
+                duplicate_ids = set()
+                try:
+                    collection.bulk_write(requests, ordered=False)
+                except BulkWriteError as e:
+                    for error in e.details.get('writeErrors', []):
+                        if is_duplicate_book_error(error):
+                            # Retrying can't succeed, so drop it from the queue
+                            duplicate_ids.update(request_ids[error['index']])
+                        elif error.get('code') != 11000:
+                            # A duplicate _id means an earlier, interrupted flush already got it there
+                            failed_ids.update(request_ids[error['index']])
+                except ConnectionFailure:
+                    self.online = False
+                    raise
+                if book_ids:
+                    self.record_deletions(book_ids)
+                
+                written = [book_id for ids in request_ids for book_id in ids if book_id not in failed_ids]
+                self.local_store.forget(written)
+                flushed += len(written)
+                metrics.increment("database.writes_flushed", len(written))
+                if duplicate_ids:
+                    self.book_keys.discard(duplicate_ids)
+                    self.rejected_inserts.extend(book['_id'] for book in books if book['_id'] in duplicate_ids)
+                    self.rejected_updates.extend(book_id for book_id, _ in updates if book_id in duplicate_ids)
+                if failed_ids:
+                    raise RuntimeError(f"{len(failed_ids)} changes could not be saved to MongoDB")
+                if duplicate_ids:
+                    raise RuntimeError(f"{len(duplicate_ids)} changes were not saved because they "
+                                       "would duplicate the title and author of another book")
+        return flushed
+        
+    def take_rejected_inserts(self):
+        """Return and forget the _ids of queued books flush_writes couldn't insert as duplicates"""
+        book_ids = set()
+        while self.rejected_inserts:
+            book_ids.add(self.rejected_inserts.popleft())
+        return book_ids
+        
+    def take_rejected_updates(self):
+        """Return and forget the _ids of books whose queued edits flush_writes couldn't
+        save as duplicates"""
+        book_ids = set()
+        while self.rejected_updates:
+            book_ids.add(self.rejected_updates.popleft())
+        return book_ids
+        
+    def queue_write(self, method_name, *args):
+        """Record a write in the local store for the next flush_writes.
+        
+        Flushes straight away once write_batch_size books are queued. Without a
+        local store the write goes to MongoDB directly.
+        """
+        if self.local_store is None:
+            return self.call_storage(method_name, *args)
+        with self.write_lock:
+            result = getattr(self.local_store, method_name)(*args)
+        if self.is_online() and self.local_store.pending_count() >= self.write_batch_size:
             try:
-                for book in self.books_collection.find():
-                    # Convert MongoDB _id to string representation for internal tracking
-                    book_dict = {'_id': str(book['_id'])}
-                    
-                    # Add all fields from the book document
-                    for key, value in book.items():
-                        if key != '_id':  # Skip the ObjectId as we've already converted it
-                            book_dict[key] = value
-                            
-                    books.append(book_dict)
+                self.flush_writes()
             except Exception as e:
-                if self.parent:
-                    QMessageBox.warning(self.parent, "Database Error", f"Error loading books: {str(e)}")
-        return books
-    
-    def add_book(self, book):
-        if self.books_collection is not None:
+                # The write is queued either way; the next flush retries it
+                print(f"Error flushing writes: {e}")
+        return result
+        
+    def call_storage(self, method_name, *args):
+        """Call a storage method on the current backend, falling back to the local
+        store if MongoDB turns out to be unreachable"""
+        storage = self.storage()
+        if storage is not self:
+            return getattr(self.local_store, method_name)(*args)
+        try:
+            # Let MongoDB catch up on queued writes first, so reads see them
+            if self.local_store is not None and self.local_store.has_pending_changes():
+                try:
+                    self.flush_writes()
+                except RuntimeError as e:
+                    print(f"Error flushing writes: {e}")
+            return getattr(self, "mongo_" + method_name)(*args)
+        except ConnectionFailure:
+            if self.local_store is None:
+                raise
+            self.online = False
+            metrics.increment("database.local_fallbacks")
+            return getattr(self.local_store, method_name)(*args)
+        
+    def set_projected_fields(self, custom_field_names):
+        """Load only the standard fields and these custom fields with books from now on"""
+        self.projected_fields = frozenset(BookRecord.STANDARD_FIELDS + tuple(custom_field_names))
+        
+    def projection(self, fields=None):
+        """Build the MongoDB projection for fields, by default the projected fields"""
+        fields = self.projected_fields if fields is None else fields
+        if fields is None:
+            return None
+        return dict.fromkeys(fields, 1)
+        
+    def iter_books(self, batch_size=1000, fields=None):
+        """Yield every book from a cursor without holding the collection in memory,
+        with only the given fields if any"""
+        return self.call_storage("iter_books", batch_size, fields)
+        
+    def mongo_iter_books(self, batch_size=1000, fields=None):
+        if self.books_collection is None:
+            return
+        loaded_fields = None if fields is None else frozenset(fields)
+        for document in self.books_collection.find({}, self.projection(loaded_fields)).batch_size(batch_size):
+            yield book_from_document(document, loaded_fields)
+        
+    @metrics.timed("database.fetch_fields")
+    def fetch_fields(self, book_ids, field_names):
+        """Fetch fields books were loaded without, as {_id: {field: value}}; fields a
+        book doesn't have are left out. Raises on database errors."""
+        return self.call_storage("fetch_fields", book_ids, field_names)
+        
+    def mongo_fetch_fields(self, book_ids, field_names):
+        if self.books_collection is None:
+            return {}
+        documents = self.books_collection.find({"_id": {"$in": [ObjectId(book_id) for book_id in book_ids]}},
+                                               dict.fromkeys(field_names, 1))
+        return {str(document.pop("_id")): document for document in documents}
+            
+    @metrics.timed("database.count_books")
+    def count_books(self):
+        """Return the approximate number of books, from collection metadata"""
+        return self.call_storage("count_books")
+        
+    def mongo_count_books(self):
+        if self.books_collection is None:
+            return 0
+        return self.books_collection.estimated_document_count()
+        
+    @metrics.timed("database.collection_stats")
+    def collection_stats(self, field_names):
+        """Compute CollectionStats for the given custom fields on the server; raises
+        on database errors"""
+        return self.call_storage("collection_stats", field_names)
+        
+    def mongo_collection_stats(self, field_names):
+        if self.books_collection is None:
+            return CollectionStats(field_names)
+        totals = {"_id": None, "count": {"$sum": 1}, "total_price": {"$sum": "$price"}}
+        for index, field_name in enumerate(field_names):
+            # Counts books where the field is neither missing, null nor empty
+            totals[f"filled{index}"] = {
+                "$sum": {"$cond": [{"$eq": [{"$ifNull": ["$" + field_name, ""]}, ""]}, 0, 1]}}
+        result = next(self.books_collection.aggregate([{"$group": totals}]), None) or {}
+        
+        stats = CollectionStats(field_names, result.get("count", 0), result.get("total_price", 0.0))
+        for document in self.books_collection.aggregate(
+                [{"$group": {"_id": "$author_name", "count": {"$sum": 1}}}], allowDiskUse=True):
+            # Books without an author are counted together with those with an empty one
+            stats.authors[document["_id"] or ""] += document["count"]
+        for index, field_name in enumerate(field_names):
+            stats.filled[field_name] = result.get(f"filled{index}", 0)
+        return stats
+        
+    @metrics.timed("database.ensure_indexes")
+    def ensure_indexes(self, custom_field_names):
+        """Create the indexes searching relies on; existing ones are left as they are.
+        
+        Only the custom fields given are indexed, as MongoDB allows 64 indexes per
+        collection. Raises on database errors, so it can run on a DatabaseWorker thread.
+        """
+        if self.storage() is not self:
+            return False
+        # First, so running out of indexes can't leave duplicates unchecked
+        self.create_book_key_index()
+        self.books_collection.create_index(
+            [("title", pymongo.TEXT), ("author_name", pymongo.TEXT)],
+            name="title_author_text"
+        )
+        # Incremental sync polls on these
+        self.books_collection.create_index("updated_at")
+        self.deleted_collection.create_index("deleted_at", expireAfterSeconds=DELETED_BOOKS_TTL_SECONDS)
+        # Single-field indexes serve range filters and sorting in either direction
+        self.books_collection.create_index("title")
+        self.books_collection.create_index("author_name")
+        self.books_collection.create_index("price")
+        self.ensure_field_indexes(custom_field_names)
+        return True
+        
+    @metrics.timed("database.ensure_field_indexes")
+    def ensure_field_indexes(self, field_names):
+        """Index custom fields not indexed yet, e.g. once they're searched on or sorted by.
+        
+        A field MongoDB won't index, such as one past the collection's index limit,
+        is left unindexed; other database errors are raised.
+        """
+        if self.storage() is not self:
+            return False
+        for field_name in field_names:
+            if field_name in self.indexed_fields:
+                continue
             try:
-                result = self.books_collection.insert_one(book)
-                # Return the MongoDB _id as string
-                return str(result.inserted_id)
-            except Exception as e:
-                if self.parent:
-                    QMessageBox.warning(self.parent, "Database Error", f"Error saving book: {str(e)}")
-        return None
+                self.books_collection.create_index(field_name)
+            except OperationFailure as e:
+                print(f"Not indexing {field_name}: {e}")
+            else:
+                self.indexed_fields.add(field_name)
+        return True
+        
+    def create_book_key_index(self):
+        """Make MongoDB reject books duplicating another's title and author.
+        
+        Sparse, as books written by older versions have no key until
+        find_duplicate_groups adds one. Returns False while existing duplicates
+        prevent building it.
+        """
+        try:
+            self.books_collection.create_index(BOOK_KEY_FIELD, name=BOOK_KEY_FIELD, unique=True, sparse=True)
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            print(f"Not enforcing unique titles and authors until duplicates are removed: {e}")
+            return False
+        return True
+        
+    @metrics.timed("database.load_book_keys")
+    def load_book_keys(self):
+        """Fill the in-memory key index from every stored book, returning its size.
+        
+        Reads only titles and authors. Raises on database errors, so it can run
+        on a DatabaseWorker thread.
+        """
+        if not self.is_online():
+            return len(self.book_keys)
+        self.flush_writes()
+        for document in self.books_collection.find({}, {"title": 1, "author_name": 1}).batch_size(5000):
+            self.book_keys.add(key_of(document), str(document['_id']))
+        return len(self.book_keys)
         
-    def remove_book(self, book_id):
-        if self.books_collection is not None:
+    def backfill_book_keys(self):
+        """Add the key to books written before it existed.
+        
+        Returns {key: [_id]} for books the unique index turned away because
+        another book already holds their key.
+        """
+        conflicts = {}
+        cursor = self.books_collection.find({BOOK_KEY_FIELD: {"$exists": False}},
+                                            {"title": 1, "author_name": 1})
+        while True:
+            documents = list(itertools.islice(cursor, SYNC_BATCH_SIZE))
+            if not documents:
+                break
+            keys = [key_of(document) for document in documents]
+            requests = [UpdateOne({"_id": document["_id"]}, {"$set": {BOOK_KEY_FIELD: key}})
+                        for document, key in zip(documents, keys)]
             try:
-                self.books_collection.delete_one({"_id": ObjectId(book_id)})
-                return True
-            except Exception as e:
-                if self.parent:
-                    QMessageBox.warning(self.parent, "Database Error", f"Error removing book: {str(e)}")
-        return False
+                self.books_collection.bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get('writeErrors', []):
+                    if error.get('code') != 11000:
+                        raise
+                    conflicts.setdefault(keys[error['index']], []).append(documents[error['index']]["_id"])
+        return conflicts
+        
+    @metrics.timed("database.find_duplicate_groups")
+    def find_duplicate_groups(self):
+        """Find books sharing a title and author with one aggregation.
+        
+        Returns a list of groups, each a list of books oldest first. Raises on
+        database errors, so it can run on a DatabaseWorker thread.
+        """
+        if not self.is_online():
+            raise ConnectionError("Finding duplicates needs a connection to MongoDB")
+        self.flush_writes()
+        conflicts = self.backfill_book_keys()
+        
+        groups = {}
+        pipeline = [
+            {"$match": {BOOK_KEY_FIELD: {"$exists": True}}},
+            {"$group": {"_id": "$" + BOOK_KEY_FIELD, "books": {"$push": "$$ROOT"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        for group in self.books_collection.aggregate(pipeline, allowDiskUse=True):
+            groups[group["_id"]] = group["books"]
+        # Books the unique index kept from taking a key belong with the book holding it
+        for key, book_ids in conflicts.items():
+            documents = groups.setdefault(key, list(self.books_collection.find({BOOK_KEY_FIELD: key})))
+            documents.extend(self.books_collection.find({"_id": {"$in": book_ids}}))
+        
+        # ObjectIds sort by creation time
+        return [[book_from_document(document) for document in sorted(documents, key=lambda d: d["_id"])]
+                for documents in groups.values()]
+        
+    def merge_duplicates(self, groups):
+        """Merge each group of duplicates into its oldest book, returning how many were removed.
+        
+        The oldest book takes any field it leaves empty from the others before
+        they're deleted, and the key, which it may have been too late to get
+        when keys were backfilled; the unique index is then built if it was missing.
+        """
+        updates = []
+        duplicate_ids = []
+        for group in groups:
+            kept = group[0]
+            changes = {}
+            for duplicate in group[1:]:
+                for field_name, value in duplicate.items():
+                    if field_name != '_id' and value not in (None, '') and \
+                       kept.get(field_name) in (None, '') and field_name not in changes:
+                        changes[field_name] = value
+                duplicate_ids.append(duplicate['_id'])
+            if changes:
+                updates.append((kept['_id'], changes))
+        self.update_books(updates)
+        self.delete_books(duplicate_ids)
+        for group in groups:
+            self.book_keys.add(key_of(group[0]), group[0]['_id'])
+        self.flush_writes()
+        # Only now that the copies are gone can the kept books take the key
+        if groups:
+            self.books_collection.bulk_write(
+                [UpdateOne({"_id": ObjectId(group[0]['_id'])}, {"$set": {BOOK_KEY_FIELD: key_of(group[0])}})
+                 for group in groups],
+                ordered=False
+            )
+        self.create_book_key_index()
+        return len(duplicate_ids)
+        
+    @metrics.timed("database.open_books_cursor")
+    def open_books_cursor(self, query=None, sort=None):
+        """Open a paged cursor over the books matching query, or None without any storage"""
+        try:
+            return self.call_storage("open_books_cursor", query, sort)
+        except Exception as e:
+            if self.parent:
+                QMessageBox.warning(self.parent, "Database Error", f"Error loading books: {str(e)}")
+        return None
         
+    def mongo_open_books_cursor(self, query=None, sort=None):
+        if self.books_collection is None:
+            return None
+        return BookCursor(self, query, sort)
+    
+    @metrics.timed("database.insert_book")
+    def insert_book(self, book):
+        """Queue a book for insertion and return its _id as a string; raises on database errors.
+        
+        Doesn't touch the GUI, so it can run on a DatabaseWorker thread.
+        """
+        book_id = self.queue_write("insert_book", book)
+        if book_id:
+            self.book_keys.add(key_of(book), book_id)
+        return book_id
+        
+    def mongo_insert_book(self, book):
+        if self.books_collection is None:
+            return None
+        # Insert a copy so the driver doesn't add an ObjectId to the caller's dict
+        result = self.books_collection.insert_one(document_from_book(book))
+        # Return the MongoDB _id as string
+        return str(result.inserted_id)
+    
+    @metrics.timed("database.insert_books")
+    def insert_books(self, books):
+        """Insert books with one unordered insert_many, returning (inserted count, errors).
+        
+        errors is a list of (index into books, message) for rows the server rejected;
+        other database errors are raised.
+        """
+        inserted, errors = self.call_storage("insert_books", books)
+        failed = {index for index, _ in errors}
+        for index, book in enumerate(books):
+            if '_id' in book and index not in failed:
+                self.book_keys.add(key_of(book), book['_id'])
+        return inserted, errors
+        
+    def mongo_insert_books(self, books):
+        if self.books_collection is None or not books:
+            return 0, []
+        try:
+            result = self.books_collection.insert_many([document_from_book(book) for book in books],
+                                                       ordered=False)
+            return len(result.inserted_ids), []
+        except BulkWriteError as e:
+            errors = [(error['index'], error.get('errmsg', 'Write failed'))
+                      for error in e.details.get('writeErrors', [])]
+            return e.details.get('nInserted', len(books) - len(errors)), errors
+    
+    @metrics.timed("database.delete_book")
+    def delete_book(self, book_id):
+        """Queue deleting a book by its string _id; raises on database errors"""
+        result = self.queue_write("delete_book", book_id)
+        self.book_keys.discard([book_id])
+        return result
+        
+    def mongo_delete_book(self, book_id):
+        if self.books_collection is None:
+            return False
+        self.books_collection.delete_one({"_id": ObjectId(book_id)})
+        self.record_deletions([book_id])
+        return True
+    
+    @metrics.timed("database.delete_books")
+    def delete_books(self, book_ids):
+        """Queue deleting books by their string _ids, returning how many were
+        queued; raises on database errors"""
+        result = self.queue_write("delete_books", book_ids)
+        self.book_keys.discard(book_ids)
+        return result
+        
+    def mongo_delete_books(self, book_ids):
+        if self.books_collection is None or not book_ids:
+            return 0
+        result = self.books_collection.delete_many(
+            {"_id": {"$in": [ObjectId(book_id) for book_id in book_ids]}})
+        self.record_deletions(book_ids)
+        return result.deleted_count
+    
+    @metrics.timed("database.remove_books")
+    def remove_books(self, book_ids):
+        """Queue deleting books, first reading every field of them, as {_id: book},
+        so restore_books can put back fields that were never loaded; raises on
+        database errors"""
+        books = self.find_books_by_id(book_ids)
+        self.delete_books(book_ids)
+        return books
+        
+    def find_books_by_id(self, book_ids):
+        """Return the stored books with these _ids, with all their fields, as {_id: book}"""
+        return self.call_storage("find_books_by_id", book_ids)
+        
+    def mongo_find_books_by_id(self, book_ids):
+        if self.books_collection is None or not book_ids:
+            return {}
+        documents = self.books_collection.find({"_id": {"$in": [ObjectId(book_id) for book_id in book_ids]}})
+        return {str(document['_id']): book_from_document(document) for document in documents}
+    
+    @metrics.timed("database.restore_books")
+    def restore_books(self, books):
+        """Re-insert deleted books under their original _ids, e.g. to undo a removal.
+        
+        Books whose title and author another book has taken since are skipped.
+        Returns (inserted count, errors) like insert_books.
+        """
+        errors = []
+        restorable = []
+        for index, book in enumerate(books):
+            if self.book_keys.claim(key_of(book), book['_id']):
+                restorable.append((index, book))
+            else:
+                errors.append((index, "A book with the same title and author is already in the collection"))
+        inserted, failed = self.call_storage("restore_books", [book for _, book in restorable])
+        # Errors index into the books restored, so map them back
+        for index, message in failed:
+            errors.append((restorable[index][0], message))
+        self.book_keys.discard([restorable[index][1]['_id'] for index, _ in failed])
+        return inserted, sorted(errors)
+        
+    def mongo_restore_books(self, books):
+        inserted, errors = self.mongo_insert_books(books)
+        # Stop polling workstations from deleting them again
+        failed = {index for index, _ in errors}
+        restored_ids = [ObjectId(book['_id']) for index, book in enumerate(books) if index not in failed]
+        if restored_ids:
+            self.deleted_collection.delete_many({"_id": {"$in": restored_ids}})
+        return inserted, errors
+    
+    @metrics.timed("database.update_books")
+    def update_books(self, updates):
+        """Queue (book _id, changed fields) pairs, sent as $set updates of just those
+        fields, returning how many were queued; raises on database errors"""
+        result = self.queue_write("update_books", updates)
+        for book_id, changes in updates:
+            if 'title' in changes and 'author_name' in changes:
+                self.book_keys.add(key_of(changes), book_id)
+        return result
+        
+    def mongo_update_books(self, updates):
+        if self.books_collection is None or not updates:
+            return 0
+        requests = [UpdateOne({"_id": ObjectId(book_id)}, update_from_changes(changes))
+                    for book_id, changes in updates]
+        return self.books_collection.bulk_write(requests, ordered=False).matched_count
+    
+    @metrics.timed("database.record_deletions")
+    def record_deletions(self, book_ids):
+        """Remember deleted _ids for polling workstations; the TTL index expires them"""
+        deleted_at = datetime.now(timezone.utc)
+        try:
+            self.deleted_collection.insert_many(
+                [{"_id": ObjectId(book_id), "deleted_at": deleted_at} for book_id in book_ids],
+                ordered=False
+            )
+        except BulkWriteError:
+            pass  # Already recorded
+    
+    @metrics.timed("database.server_info")
+    def server_info(self):
+        """Return the server's hello response; raises on database errors"""
+        return self.client.admin.command("hello")
+    
+    @metrics.timed("database.changes_since")
+    def changes_since(self, since):
+        """Return (changed books, deleted _ids) since a server time; raises on database errors.
+        
+        Books are matched on updated_at, or on the time in their ObjectId for books
+        written before updated_at existed.
+        """
+        query = {"$or": [{"updated_at": {"$gte": since}},
+                         {"_id": {"$gte": ObjectId.from_datetime(since)}}]}
+        loaded_fields = self.projected_fields
+        books = [book_from_document(document, loaded_fields)
+                 for document in self.books_collection.find(query, self.projection(loaded_fields))]
+        deleted_ids = [str(document["_id"]) for document in
+                       self.deleted_collection.find({"deleted_at": {"$gte": since}}, {"_id": 1})]
+        return books, deleted_ids
+    
+    @metrics.timed("database.close_connection")
     def close_connection(self):
+        if self.local_store is not None:
+            self.local_store.close()
         if self.client:
             try:
                 self.client.close()
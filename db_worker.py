@@ -0,0 +1,120 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QCoreApplication, pyqtSignal
+
+# Threads available for database round trips
+DEFAULT_MAX_THREADS = 4
+
+class DatabaseTaskSignals(QObject):
+    """Signals emitted by a DatabaseTask, delivered on the GUI thread"""
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    # (done, total) for long-running tasks
+    progress = pyqtSignal(int, int)
+
+class DatabaseTask(QRunnable):
+    """Runs a single database call on a pool thread.
+    
+    Long-running calls can opt in to progress reporting, in which case fn is
+    also passed progress(done, total) and cancelled() keyword arguments.
+    """
+    def __init__(self, fn, *args, report_progress=False):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.report_progress = report_progress
+        self.cancel_requested = False
+        self.signals = DatabaseTaskSignals()
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def is_cancelled(self):
+        return self.cancel_requested
+
+    def run(self):
+        try:
+            if self.report_progress:
+                result = self.fn(*self.args, progress=self.signals.progress.emit,
+                                 cancelled=self.is_cancelled)
+            else:
+                result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+class DatabaseWorker(QObject):
+    """Runs DatabaseHandler operations off the GUI thread and reports back through Qt signals"""
+    def __init__(self, db_handler, parent=None, max_threads=DEFAULT_MAX_THREADS):
+        super().__init__(parent)
+        self.db_handler = db_handler
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        # Keep tasks alive until their signals have been delivered
+        self.tasks = set()
+
+    def submit(self, fn, *args, on_finished=None, on_failed=None, on_progress=None):
+        """Run fn(*args) on the pool, calling on_finished(result) or on_failed(message) on the GUI thread.
+        
+        Passing on_progress makes this a cancellable task with progress reporting (see DatabaseTask).
+        """
+        task = DatabaseTask(fn, *args, report_progress=on_progress is not None)
+        task.setAutoDelete(False)
+        # Forget the task before its callbacks run, so they can wait on other work
+        task.signals.finished.connect(lambda _: self.tasks.discard(task))
+        task.signals.failed.connect(lambda _: self.tasks.discard(task))
+        if on_finished:
+            task.signals.finished.connect(on_finished)
+        if on_failed:
+            task.signals.failed.connect(on_failed)
+        if on_progress:
+            task.signals.progress.connect(on_progress)
+        self.tasks.add(task)
+        self.pool.start(task)
+        return task
+
+    def add_book(self, book, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.insert_book, book,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def remove_book(self, book_id, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.delete_book, book_id,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def remove_books(self, book_ids, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.remove_books, book_ids,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def restore_books(self, books, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.restore_books, books,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def update_books(self, updates, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.update_books, updates,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def flush_writes(self, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.flush_writes,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def fetch_books(self, book_cursor, count, on_finished=None, on_failed=None):
+        return self.submit(book_cursor.fetch, count,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def fetch_fields(self, book_ids, field_names, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.fetch_fields, book_ids, field_names,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def ensure_indexes(self, custom_field_names, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.ensure_indexes, custom_field_names,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def ping(self, on_finished=None, on_failed=None):
+        return self.submit(self.db_handler.ping,
+                           on_finished=on_finished, on_failed=on_failed)
+
+    def wait_for_done(self):
+        """Block until queued work finishes and deliver its results"""
+        # Delivered results may queue follow-up work, so repeat until nothing is left
+        while self.tasks:
+            self.pool.waitForDone()
+            QCoreApplication.sendPostedEvents()
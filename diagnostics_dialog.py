@@ -0,0 +1,99 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog,
+                             QMessageBox, QAbstractItemView)
+from PyQt5.QtCore import Qt, QTimer
+import metrics
+
+SPAN_COLUMNS = ["Span", "Count", "Mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"]
+
+class DiagnosticsDialog(QDialog):
+    """Shows the timing spans and counters collected in metrics.registry"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostics")
+        self.setGeometry(250, 250, 750, 500)
+        self.initUI()
+        self.refresh()
+
+        # Keep the figures live while the window is open
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+
+        layout.addWidget(QLabel("Timings"))
+        self.span_table = QTableWidget(0, len(SPAN_COLUMNS))
+        self.span_table.setHorizontalHeaderLabels(SPAN_COLUMNS)
+        self.span_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.span_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.span_table.verticalHeader().setVisible(False)
+        layout.addWidget(self.span_table, 3)
+
+        layout.addWidget(QLabel("Counters"))
+        self.counter_table = QTableWidget(0, 2)
+        self.counter_table.setHorizontalHeaderLabels(["Counter", "Value"])
+        self.counter_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.counter_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.counter_table.verticalHeader().setVisible(False)
+        layout.addWidget(self.counter_table, 1)
+
+        button_layout = QHBoxLayout()
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        button_layout.addWidget(reset_button)
+
+        export_button = QPushButton("Export...")
+        export_button.clicked.connect(self.export_metrics)
+        button_layout.addWidget(export_button)
+
+        button_layout.addStretch()
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def refresh(self):
+        snapshot = metrics.registry.snapshot()
+
+        spans = snapshot["spans"]
+        self.span_table.setRowCount(len(spans))
+        for row, (name, histogram) in enumerate(spans.items()):
+            mean = histogram["sum"] / histogram["count"] if histogram["count"] else 0.0
+            values = [name, str(histogram["count"])] + [
+                f"{seconds * 1000:.1f}" for seconds in
+                (mean, histogram["p50"], histogram["p95"], histogram["p99"], histogram["max"])
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.span_table.setItem(row, column, item)
+
+        counters = snapshot["counters"]
+        self.counter_table.setRowCount(len(counters))
+        for row, (name, value) in enumerate(counters.items()):
+            self.counter_table.setItem(row, 0, QTableWidgetItem(name))
+            item = QTableWidgetItem(str(value))
+            item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            self.counter_table.setItem(row, 1, item)
+
+    def reset(self):
+        metrics.registry.reset()
+        self.refresh()
+
+    def export_metrics(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Export Metrics", "book_app_metrics.prom",
+            "Prometheus Text (*.prom);;JSON Files (*.json);;All Files (*)"
+        )
+        if not file_path:
+            return
+        try:
+            metrics.registry.write(file_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Export Error", f"Error exporting metrics: {str(e)}")
@@ -0,0 +1,303 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import Counter
+from bson import ObjectId
+from book_record import BookRecord
+from book_stats import CollectionStats
+
+# Fields stored in their own columns; everything else goes into the JSON fields column
+STANDARD_FIELDS = ("title", "author_name", "price")
+
+# Columns the local store can sort on directly
+SORT_COLUMNS = {"_id": "rowid", "title": "title COLLATE NOCASE",
+                "author_name": "author_name COLLATE NOCASE", "price": "price"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    author_name TEXT NOT NULL DEFAULT '',
+    price REAL NOT NULL DEFAULT 0,
+    fields TEXT NOT NULL DEFAULT '{}',
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS books_title ON books (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS books_author_name ON books (author_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS books_price ON books (price);
+CREATE INDEX IF NOT EXISTS books_deleted ON books (deleted);
+"""
+
+# Values of the deleted column: books added offline, tombstones for MongoDB books
+# deleted offline, and edits to MongoDB books, whose fields column holds the changes
+ADDED, DELETED, EDITED = 0, 1, 2
+
+# Fixed statement texts, so sqlite3's statement cache prepares each only once
+INSERT_SQL = "INSERT OR REPLACE INTO books (id, title, author_name, price, fields, deleted) VALUES (?, ?, ?, ?, ?, 0)"
+TOMBSTONE_SQL = "INSERT OR REPLACE INTO books (id, deleted) VALUES (?, 1)"
+DELETE_SQL = "DELETE FROM books WHERE id = ?"
+DROP_ADDED_SQL = "DELETE FROM books WHERE id = ? AND deleted = 0"
+SELECT_STATE_SQL = "SELECT deleted, title, author_name, price, fields FROM books WHERE id = ?"
+UPDATE_SQL = "UPDATE books SET title = ?, author_name = ?, price = ?, fields = ? WHERE id = ?"
+EDIT_SQL = "INSERT OR REPLACE INTO books (id, fields, deleted) VALUES (?, ?, 2)"
+SELECT_COLUMNS = "SELECT rowid, id, title, author_name, price, fields FROM books"
+
+def book_to_row(book_id, book):
+    fields = {key: value for key, value in book.items()
+              if key not in STANDARD_FIELDS and key != '_id'}
+    return (book_id, book.get('title', ''), book.get('author_name', ''),
+            float(book.get('price', 0) or 0), json.dumps(fields))
+
+def row_to_book(row):
+    _, book_id, title, author_name, price, fields = row
+    book = BookRecord(_id=book_id, title=title, author_name=author_name, price=price)
+    book.update(json.loads(fields))
+    return book
+
+def translate_query(query):
+    """Translate the MongoDB filters built by build_search_query into SQL"""
+    clauses = ["deleted = 0"]
+    params = []
+    for key, value in (query or {}).items():
+        if key == "$text":
+            words = value["$search"].split()
+            if words:
+                # Like $text, match books containing any of the words
+                matches = []
+                for word in words:
+                    matches.append("title LIKE ? OR author_name LIKE ?")
+                    params.extend([f"%{word}%", f"%{word}%"])
+                clauses.append("(" + " OR ".join(matches) + ")")
+        elif key == "price":
+            if "$gte" in value:
+                clauses.append("price >= ?")
+                params.append(value["$gte"])
+            if "$lte" in value:
+                clauses.append("price <= ?")
+                params.append(value["$lte"])
+        else:
+            clauses.append("json_extract(fields, ?) = ?")
+            params.extend([json_path(key), value])
+    return " AND ".join(clauses), params
+
+def json_path(field_name):
+    return '$."' + field_name.replace('"', '\\"') + '"'
+
+class LocalBookCursor:
+    """Pages through the local store; same interface as database_handler.BookCursor"""
+    def __init__(self, store, query=None, sort=None, batch_size=100):
+        self.store = store
+        self.where, self.params = translate_query(query)
+        self.order_by, self.order_params = self.build_order_by(sort)
+        self.batch_size = batch_size
+        self.offset = 0
+        self.exhausted = False
+        self.skip_ids = set()
+
+    def build_order_by(self, sort):
+        """Return the ORDER BY clause and its parameters"""
+        if sort is None:
+            return "rowid", []
+        field_name, direction = sort
+        order = "ASC" if direction > 0 else "DESC"
+        column = SORT_COLUMNS.get(field_name)
+        if column is not None:
+            return f"{column} {order}, rowid {order}", []
+        return f"json_extract(fields, ?) {order}, rowid {order}", [json_path(field_name)]
+
+    def fetch(self, count):
+        if self.exhausted:
+            return []
+        rows = self.store.select(
+            f"{SELECT_COLUMNS} WHERE {self.where} ORDER BY {self.order_by} LIMIT ? OFFSET ?",
+            self.params + self.order_params + [count, self.offset]
+        )
+        self.offset += len(rows)
+        if len(rows) < count:
+            self.close()
+        return [book for book in map(row_to_book, rows) if book['_id'] not in self.skip_ids]
+
+    def close(self):
+        self.exhausted = True
+
+class LocalBookStore:
+    """Embedded SQLite storage for changes that haven't reached MongoDB yet.
+
+    Provides the same storage methods as DatabaseHandler's MongoDB path
+    (find_books_by_id, iter_books, fetch_fields, count_books,
+    open_books_cursor, collection_stats, insert_book, insert_books,
+    delete_book, delete_books, restore_books, update_books).
+    It holds books added, plus tombstones and edits for MongoDB books deleted
+    or changed, until DatabaseHandler.flush_writes sends them: briefly while
+    online, and while offline until MongoDB is reachable again, when reads
+    are served from it too.
+    """
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection shared by the worker threads, serialised by a lock
+        self.connection = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # WAL with synchronous=NORMAL is durable across application crashes
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+
+    def select(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def iter_books(self, batch_size=1000, fields=None):
+        # Rows hold every field already, so fields isn't needed to narrow the read
+        cursor = LocalBookCursor(self, batch_size=batch_size)
+        while not cursor.exhausted:
+            yield from cursor.fetch(batch_size)
+
+    def fetch_fields(self, book_ids, field_names):
+        """Return the named fields of books added here, as {_id: {field: value}}"""
+        book_ids = list(book_ids)
+        values = {}
+        # Stay well under SQLite's limit on query parameters
+        for start in range(0, len(book_ids), 500):
+            chunk = book_ids[start:start + 500]
+            for book_id, fields in self.select(
+                    f"SELECT id, fields FROM books WHERE deleted = 0 AND id IN ({', '.join('?' * len(chunk))})",
+                    chunk):
+                fields = json.loads(fields)
+                values[book_id] = {name: fields[name] for name in field_names if name in fields}
+        return values
+
+    def count_books(self):
+        return self.select("SELECT COUNT(*) FROM books WHERE deleted = 0")[0][0]
+
+    def open_books_cursor(self, query=None, sort=None):
+        return LocalBookCursor(self, query, sort)
+
+    def collection_stats(self, field_names):
+        """Compute CollectionStats with SQL aggregates over the stored books"""
+        count, total_price = self.select(
+            "SELECT COUNT(*), TOTAL(price) FROM books WHERE deleted = 0")[0]
+        authors = Counter()
+        for author_name, books in self.select(
+                "SELECT author_name, COUNT(*) FROM books WHERE deleted = 0 GROUP BY author_name"):
+            authors[author_name or ""] += books
+        filled = {}
+        if field_names:
+            columns = ", ".join(
+                "SUM(CASE WHEN COALESCE(json_extract(fields, ?), '') != '' THEN 1 ELSE 0 END)"
+                for _ in field_names)
+            sums = self.select(f"SELECT {columns} FROM books WHERE deleted = 0",
+                               [json_path(field_name) for field_name in field_names])[0]
+            filled = dict(zip(field_names, (value or 0 for value in sums)))
+        return CollectionStats(field_names, count, total_price, authors, filled)
+
+    def insert_book(self, book):
+        """Store a book under its _id, or a new ObjectId, so it keeps its _id once synced"""
+        book_id = book.get('_id') or str(ObjectId())
+        with self.lock, self.connection:
+            self.connection.execute(INSERT_SQL, book_to_row(book_id, book))
+        return book_id
+
+    def insert_books(self, books):
+        rows = [book_to_row(book.get('_id') or str(ObjectId()), book) for book in books]
+        with self.lock, self.connection:
+            self.connection.executemany(INSERT_SQL, rows)
+        return len(rows), []
+
+    def delete_book(self, book_id):
+        """Drop a book added offline, or remember to delete a MongoDB book on sync"""
+        with self.lock, self.connection:
+            cursor = self.connection.execute(DROP_ADDED_SQL, (book_id,))
+            if cursor.rowcount == 0:
+                self.connection.execute(TOMBSTONE_SQL, (book_id,))
+        return True
+
+    def delete_books(self, book_ids):
+        """Drop or tombstone several books in one transaction"""
+        with self.lock, self.connection:
+            for book_id in book_ids:
+                cursor = self.connection.execute(DROP_ADDED_SQL, (book_id,))
+                if cursor.rowcount == 0:
+                    self.connection.execute(TOMBSTONE_SQL, (book_id,))
+        return len(book_ids)
+    
+    def find_books_by_id(self, book_ids):
+        """Return books added here, by _id"""
+        book_ids = list(book_ids)
+        books = {}
+        # Stay well under SQLite's limit on query parameters
+        for start in range(0, len(book_ids), 500):
+            chunk = book_ids[start:start + 500]
+            for row in self.select(
+                    f"{SELECT_COLUMNS} WHERE deleted = 0 AND id IN ({', '.join('?' * len(chunk))})", chunk):
+                book = row_to_book(row)
+                books[book['_id']] = book
+        return books
+
+    def restore_books(self, books):
+        """Re-add deleted books.
+
+        A MongoDB book whose deletion hasn't been sent yet still has its document
+        there, so its tombstone becomes an edit of the given fields, leaving fields
+        the caller didn't load intact. Other books are inserted whole.
+        """
+        rows = []
+        with self.lock, self.connection:
+            for book in books:
+                state = self.connection.execute(SELECT_STATE_SQL, (book['_id'],)).fetchone()
+                if state is not None and state[0] == DELETED:
+                    fields = {key: value for key, value in book.items() if key != '_id'}
+                    self.connection.execute(EDIT_SQL, (book['_id'], json.dumps(fields)))
+                else:
+                    rows.append(book_to_row(book['_id'], book))
+            self.connection.executemany(INSERT_SQL, rows)
+        return len(books), []
+    
+    def update_books(self, updates):
+        """Apply (book _id, changed fields) pairs to books added offline, and
+        remember them for MongoDB books so they're sent on sync"""
+        with self.lock, self.connection:
+            for book_id, changes in updates:
+                row = self.connection.execute(SELECT_STATE_SQL, (book_id,)).fetchone()
+                if row is None:
+                    self.connection.execute(EDIT_SQL, (book_id, json.dumps(changes)))
+                elif row[0] == ADDED:
+                    book = row_to_book((None, book_id) + tuple(row[1:]))
+                    book.update(changes)
+                    self.connection.execute(UPDATE_SQL, book_to_row(book_id, book)[1:] + (book_id,))
+                elif row[0] == EDITED:
+                    fields = json.loads(row[4])
+                    fields.update(changes)
+                    self.connection.execute(EDIT_SQL, (book_id, json.dumps(fields)))
+                # A tombstoned book stays deleted
+        return len(updates)
+    
+    def forget(self, book_ids):
+        """Remove entries once MongoDB has them"""
+        with self.lock, self.connection:
+            self.connection.executemany(DELETE_SQL, [(book_id,) for book_id in book_ids])
+
+    def pending_inserts(self, limit):
+        return [row_to_book(row) for row in self.select(
+            f"{SELECT_COLUMNS} WHERE deleted = 0 ORDER BY rowid LIMIT ?", (limit,))]
+
+    def pending_updates(self, limit):
+        return [(row[0], json.loads(row[1])) for row in self.select(
+            "SELECT id, fields FROM books WHERE deleted = 2 ORDER BY rowid LIMIT ?", (limit,))]
+
+    def pending_deletes(self, limit):
+        return [row[0] for row in self.select(
+            "SELECT id FROM books WHERE deleted = 1 ORDER BY rowid LIMIT ?", (limit,))]
+
+    def has_pending_changes(self):
+        return bool(self.select("SELECT 1 FROM books LIMIT 1"))
+
+    def pending_count(self):
+        return self.select("SELECT COUNT(*) FROM books")[0][0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -1,15 +1,27 @@
 import sys
+import startup_trace
+
+# Print how long each startup phase takes; checked first so imports are timed too
+if "--startup-trace" in sys.argv:
+    sys.argv.remove("--startup-trace")
+    startup_trace.enable()
+
 from PyQt5.QtWidgets import QApplication
+startup_trace.mark("Qt imported")
 from book_management_app import BookManagementApp
+startup_trace.mark("application modules imported")
 
 def main():
     app = QApplication(sys.argv)
     
     # Set application style
     app.setStyle('Fusion')
+    startup_trace.mark("QApplication created")
     
     window = BookManagementApp()
+    startup_trace.mark("main window built")
     window.show()
+    startup_trace.mark("main window shown")
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
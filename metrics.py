@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets
+HISTOGRAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Prefix for exported Prometheus metric names
+PROMETHEUS_PREFIX = "book_app"
+
+class Histogram:
+    """Latency histogram with fixed buckets, as Prometheus keeps them"""
+    def __init__(self):
+        self.bucket_counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)  # The last is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(HISTOGRAM_BUCKETS) and seconds > HISTOGRAM_BUCKETS[index]:
+            index += 1
+        self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within its bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            upper = HISTOGRAM_BUCKETS[index] if index < len(HISTOGRAM_BUCKETS) else self.max
+            if bucket_count and cumulative + bucket_count >= rank:
+                estimate = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(estimate, self.max)
+            cumulative += bucket_count
+            lower = upper
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in HISTOGRAM_BUCKETS] + ["+Inf"],
+                                self.bucket_counts)),
+        }
+
+class MetricsRegistry:
+    """In-memory latency histograms and counters, safe to update from worker threads"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """Return the current metrics as plain data"""
+        with self.lock:
+            return {
+                "spans": {name: histogram.to_dict()
+                          for name, histogram in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def to_json(self):
+        return json.dumps(dict(self.snapshot(), timestamp=time.time()), indent=4)
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_span_duration_seconds Time spent in instrumented operations.",
+                 f"# TYPE {PROMETHEUS_PREFIX}_span_duration_seconds histogram"]
+        for name, histogram in snapshot["spans"].items():
+            label = f'span="{escape_label(name)}"'
+            cumulative = 0
+            for bound, bucket_count in histogram["buckets"].items():
+                cumulative += bucket_count
+                lines.append(f'{PROMETHEUS_PREFIX}_span_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{PROMETHEUS_PREFIX}_span_duration_seconds_sum{{{label}}} {histogram['sum']}")
+            lines.append(f"{PROMETHEUS_PREFIX}_span_duration_seconds_count{{{label}}} {histogram['count']}")
+        lines.extend([f"# HELP {PROMETHEUS_PREFIX}_events_total Counted events.",
+                      f"# TYPE {PROMETHEUS_PREFIX}_events_total counter"])
+        for name, value in snapshot["counters"].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_events_total{{event="{escape_label(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path):
+        """Write the metrics to a file, as JSON for .json paths and Prometheus text otherwise.
+
+        The file is replaced atomically, so a scraper never reads a partial file.
+        """
+        text = self.to_json() if file_path.lower().endswith('.json') else self.to_prometheus()
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(temp_path, file_path)
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# The application's metrics
+registry = MetricsRegistry()
+
+@contextmanager
+def span(name):
+    """Time the enclosed block into the named histogram, counting failures separately"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.increment(f"{name}.errors")
+        raise
+    finally:
+        registry.observe(name, time.perf_counter() - started)
+
+def timed(name):
+    """Decorator timing every call of a function as a span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def increment(name, amount=1):
+    registry.increment(name, amount)
@@ -1,37 +1,78 @@
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, 
                              QFormLayout, QCheckBox, QPushButton, QLabel,
-                             QLineEdit, QScrollArea, QWidget, QMessageBox)
-from PyQt5.QtCore import Qt, QSettings
+                             QLineEdit, QScrollArea, QWidget, QMessageBox, QListView,
+                             QAbstractItemView)
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QVariant
 from about_dialog import AboutDialog
+from database_handler import DEFAULT_MONGO_URI
+
+class CustomFieldListModel(QAbstractListModel):
+    """Editable list of custom fields; the check box marks a field as required"""
+    def __init__(self, custom_fields, parent=None):
+        super().__init__(parent)
+        self.custom_fields = custom_fields
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.custom_fields)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        field = self.custom_fields[index.row()]
+        if role == Qt.DisplayRole:
+            return field["name"]
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if field["required"] else Qt.Unchecked
+        if role == Qt.ToolTipRole:
+            return "Required" if field["required"] else "Optional"
+        return QVariant()
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        self.custom_fields[index.row()]["required"] = (value == Qt.Checked)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole, Qt.ToolTipRole])
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def add_field(self, field):
+        row = len(self.custom_fields)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.custom_fields.append(field)
+        self.endInsertRows()
+
+    def remove_field(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.custom_fields.pop(row)
+        self.endRemoveRows()
+
+    def move_field(self, row, offset):
+        """Move a field up (negative offset) or down, returning its new row"""
+        target = row + offset
+        if not 0 <= target < len(self.custom_fields) or offset == 0:
+            return row
+        # beginMoveRows takes the destination as the row to insert before
+        destination = target + 1 if offset > 0 else target
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+        self.custom_fields.insert(target, self.custom_fields.pop(row))
+        self.endMoveRows()
+        return target
 
 class SettingsDialog(QDialog):
     def __init__(self, parent=None, settings=None):
         super().__init__(parent)
         self.parent = parent
+        # An AppSettings; the fields are a copy, edited here and saved on OK
         self.settings = settings
-        self.custom_fields = []
-        self.load_custom_fields()
+        self.custom_fields = self.settings.custom_fields()
         self.initUI()
 
-    def load_custom_fields(self):
-        # Load saved custom fields from settings
-        size = self.settings.beginReadArray("customFields")
-        for i in range(size):
-            self.settings.setArrayIndex(i)
-            field_name = self.settings.value("name", "")
-            required = self.settings.value("required", False, type=bool)
-            self.custom_fields.append({"name": field_name, "required": required})
-        self.settings.endArray()
-
-    def save_custom_fields(self):
-        # Save custom fields to settings
-        self.settings.beginWriteArray("customFields")
-        for i, field in enumerate(self.custom_fields):
-            self.settings.setArrayIndex(i)
-            self.settings.setValue("name", field["name"])
-            self.settings.setValue("required", field["required"])
-        self.settings.endArray()
-
     def initUI(self):
         self.setWindowTitle("Preferences")  # Changed from "Settings" to "Preferences"
         self.setGeometry(300, 300, 500, 500)
@@ -49,7 +90,7 @@ class SettingsDialog(QDialog):
         appearance_layout = QVBoxLayout()
         
         self.dark_mode_checkbox = QCheckBox("Dark Mode")
-        self.dark_mode_checkbox.setChecked(self.settings.value("darkMode", False, type=bool))
+        self.dark_mode_checkbox.setChecked(self.settings.dark_mode)
         self.dark_mode_checkbox.toggled.connect(self.on_dark_mode_toggled)
         appearance_layout.addWidget(self.dark_mode_checkbox)
         
@@ -62,29 +103,17 @@ class SettingsDialog(QDialog):
         
         # Standard fields
         self.title_required = QCheckBox("Title")
-        self.title_required.setChecked(self.settings.value("titleRequired", True, type=bool))
-        self.title_required.toggled.connect(lambda checked: self.settings.setValue("titleRequired", checked))
+        self.title_required.setChecked(self.settings.title_required)
         required_fields_layout.addWidget(self.title_required)
         
         self.author_required = QCheckBox("Author Name")
-        self.author_required.setChecked(self.settings.value("authorRequired", False, type=bool))
-        self.author_required.toggled.connect(lambda checked: self.settings.setValue("authorRequired", checked))
+        self.author_required.setChecked(self.settings.author_required)
         required_fields_layout.addWidget(self.author_required)
         
         self.price_required = QCheckBox("Price")
-        self.price_required.setChecked(self.settings.value("priceRequired", False, type=bool))
-        self.price_required.toggled.connect(lambda checked: self.settings.setValue("priceRequired", checked))
+        self.price_required.setChecked(self.settings.price_required)
         required_fields_layout.addWidget(self.price_required)
         
-        # Add custom field checkboxes
-        self.custom_field_checkboxes = []
-        for field in self.custom_fields:
-            checkbox = QCheckBox(field["name"])
-            checkbox.setChecked(field["required"])
-            checkbox.toggled.connect(self.create_required_toggle_handler(field))
-            required_fields_layout.addWidget(checkbox)
-            self.custom_field_checkboxes.append(checkbox)
-        
         required_fields_group.setLayout(required_fields_layout)
         layout.addWidget(required_fields_group)
         
@@ -92,22 +121,28 @@ class SettingsDialog(QDialog):
         custom_fields_group = QGroupBox("Custom Fields")
         custom_fields_layout = QVBoxLayout()
         
-        # Show existing custom fields
-        if self.custom_fields:
-            current_fields_label = QLabel("Current Custom Fields:")
-            custom_fields_layout.addWidget(current_fields_label)
-            
-            for i, field in enumerate(self.custom_fields):
-                field_layout = QHBoxLayout()
-                field_layout.addWidget(QLabel(f"{i+1}. {field['name']}"))
-                
-                # Delete button
-                delete_btn = QPushButton("Delete")
-                delete_btn.setProperty("fieldIndex", i)
-                delete_btn.clicked.connect(self.delete_custom_field)
-                field_layout.addWidget(delete_btn)
-                
-                custom_fields_layout.addLayout(field_layout)
+        # Existing custom fields, edited in place; nothing is saved until OK
+        custom_fields_layout.addWidget(QLabel("Checked fields are required."))
+        self.custom_field_model = CustomFieldListModel(self.custom_fields, self)
+        self.custom_field_list = QListView()
+        self.custom_field_list.setModel(self.custom_field_model)
+        self.custom_field_list.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.custom_field_list.setUniformItemSizes(True)
+        custom_fields_layout.addWidget(self.custom_field_list)
+        
+        field_buttons_layout = QHBoxLayout()
+        move_up_btn = QPushButton("Move Up")
+        move_up_btn.clicked.connect(lambda: self.move_custom_field(-1))
+        field_buttons_layout.addWidget(move_up_btn)
+        
+        move_down_btn = QPushButton("Move Down")
+        move_down_btn.clicked.connect(lambda: self.move_custom_field(1))
+        field_buttons_layout.addWidget(move_down_btn)
+        
+        delete_btn = QPushButton("Delete")
+        delete_btn.clicked.connect(self.delete_custom_field)
+        field_buttons_layout.addWidget(delete_btn)
+        custom_fields_layout.addLayout(field_buttons_layout)
         
         # Add new custom field
         add_field_layout = QHBoxLayout()
@@ -123,6 +158,17 @@ class SettingsDialog(QDialog):
         custom_fields_group.setLayout(custom_fields_layout)
         layout.addWidget(custom_fields_group)
         
+        # Database connection
+        database_group = QGroupBox("Database")
+        database_layout = QFormLayout()
+        
+        self.mongo_uri_input = QLineEdit(self.settings.value("mongoUri", DEFAULT_MONGO_URI))
+        database_layout.addRow("MongoDB URI:", self.mongo_uri_input)
+        database_layout.addRow("", QLabel("Connection changes apply after restarting."))
+        
+        database_group.setLayout(database_layout)
+        layout.addWidget(database_group)
+        
         # Set the scroll content
         scroll_area.setWidget(scroll_content)
         main_layout.addWidget(scroll_area)
@@ -155,12 +201,6 @@ class SettingsDialog(QDialog):
         
         self.setLayout(main_layout)
     
-    def create_required_toggle_handler(self, field):
-        """Creates a handler for toggling required status of custom fields"""
-        def toggle_handler(checked):
-            field["required"] = checked
-        return toggle_handler
-        
     def add_custom_field(self):
         field_name = self.new_field_input.text().strip()
         if not field_name:
@@ -173,47 +213,54 @@ class SettingsDialog(QDialog):
             QMessageBox.warning(self, "Input Error", f"Field '{field_name}' already exists.")
             return
             
-        # Add the new field
-        self.custom_fields.append({"name": field_name, "required": False})
+        # Add the new field to the list
+        self.custom_field_model.add_field({"name": field_name, "required": False})
+        self.custom_field_list.setCurrentIndex(
+            self.custom_field_model.index(len(self.custom_fields) - 1))
         self.new_field_input.clear()
         
-        # Refresh the dialog to show the new field
-        self.save_custom_fields()
-        self.reject()
-        self.__init__(self.parent, self.settings)
-        self.exec_()
-        
+    def selected_field_row(self):
+        index = self.custom_field_list.currentIndex()
+        return index.row() if index.isValid() else -1
+    
     def delete_custom_field(self):
-        sender = self.sender()
-        index = sender.property("fieldIndex")
-        
-        if 0 <= index < len(self.custom_fields):
-            self.custom_fields.pop(index)
-            
-            # Refresh the dialog to update the field list
-            self.save_custom_fields()
-            self.reject()
-            self.__init__(self.parent, self.settings)
-            self.exec_()
+        row = self.selected_field_row()
+        if row >= 0:
+            self.custom_field_model.remove_field(row)
+    
+    def move_custom_field(self, offset):
+        row = self.selected_field_row()
+        if row >= 0:
+            row = self.custom_field_model.move_field(row, offset)
+            self.custom_field_list.setCurrentIndex(self.custom_field_model.index(row))
     
     def accept_changes(self):
-        # Save custom fields with their required status
-        for i, field in enumerate(self.custom_fields):
-            if i < len(self.custom_field_checkboxes):
-                field["required"] = self.custom_field_checkboxes[i].isChecked()
-        
-        self.save_custom_fields()
+        # Write every change at once, then flush them to storage together
+        self.settings.setValue("darkMode", self.dark_mode_checkbox.isChecked())
+        self.settings.setValue("titleRequired", self.title_required.isChecked())
+        self.settings.setValue("authorRequired", self.author_required.isChecked())
+        self.settings.setValue("priceRequired", self.price_required.isChecked())
+        self.settings.set_custom_fields(self.custom_fields)
+        
+        mongo_uri = self.mongo_uri_input.text().strip()
+        self.settings.setValue("mongoUri", mongo_uri or DEFAULT_MONGO_URI)
+        self.settings.sync()
         self.accept()
     
-    def on_dark_mode_toggled(self, checked):
-        self.settings.setValue("darkMode", checked)
+    def reject(self):
+        # Undo the dark mode preview
         self.parent.apply_theme()
+        super().reject()
+    
+    def on_dark_mode_toggled(self, checked):
+        # Preview the theme; it's saved on OK
+        self.parent.apply_theme(checked)
         self.apply_dialog_theme(checked)
         
     def apply_dialog_theme(self, dark_mode=None):
         """Apply theme to the dialog"""
         if dark_mode is None:
-            dark_mode = self.settings.value("darkMode", False, type=bool)
+            dark_mode = self.settings.dark_mode
             
         if dark_mode:
             self.setStyleSheet("""
@@ -230,7 +277,7 @@ class SettingsDialog(QDialog):
                     padding: 0 5px;
                 }
                 QLabel { color: white; }
-                QLineEdit { 
+                QLineEdit, QListView { 
                     background-color: #444; 
                     color: white; 
                     border: 1px solid #555; 
@@ -283,12 +330,11 @@ class SettingsDialog(QDialog):
             """)
     
     def show_about(self):
-        dark_mode = self.settings.value("darkMode", False, type=bool)
+        dark_mode = self.dark_mode_checkbox.isChecked()
         about_dialog = AboutDialog(self, dark_mode)
         about_dialog.exec_()
         
     def showEvent(self, event):
         """Apply theme when dialog is shown"""
         super().showEvent(event)
-        dark_mode = self.settings.value("darkMode", False, type=bool)
-        self.apply_dialog_theme(dark_mode)
+        self.apply_dialog_theme(self.dark_mode_checkbox.isChecked())
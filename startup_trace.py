@@ -0,0 +1,20 @@
+import time
+
+# Set by main.py's --startup-trace option
+enabled = False
+
+_started = time.perf_counter()
+_last = _started
+
+def enable():
+    global enabled
+    enabled = True
+
+def mark(phase):
+    """Print the time spent since the previous mark, if tracing startup"""
+    global _last
+    if not enabled:
+        return
+    now = time.perf_counter()
+    print(f"[startup] {phase}: {(now - _last) * 1000:.1f} ms (total {(now - _started) * 1000:.1f} ms)")
+    _last = now
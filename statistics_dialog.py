@@ -0,0 +1,91 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QFormLayout,
+                             QAbstractItemView)
+from PyQt5.QtCore import Qt
+
+# Authors listed, most books first; the rest are only counted
+TOP_AUTHORS_SHOWN = 100
+
+class StatisticsDialog(QDialog):
+    """Shows the collection totals the main window keeps in a CollectionStats"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent = parent
+        self.setWindowTitle("Statistics")
+        self.setGeometry(250, 250, 600, 550)
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+
+        totals_layout = QFormLayout()
+        self.count_label = QLabel()
+        totals_layout.addRow("Books:", self.count_label)
+        self.total_price_label = QLabel()
+        totals_layout.addRow("Total price:", self.total_price_label)
+        self.average_price_label = QLabel()
+        totals_layout.addRow("Average price:", self.average_price_label)
+        layout.addLayout(totals_layout)
+
+        self.authors_label = QLabel("Books per author")
+        layout.addWidget(self.authors_label)
+        self.author_table = self.create_table(["Author", "Books"])
+        layout.addWidget(self.author_table, 3)
+
+        layout.addWidget(QLabel("Custom field fill rate"))
+        self.field_table = self.create_table(["Field", "Filled", "Fill rate"])
+        layout.addWidget(self.field_table, 2)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        button_layout = QHBoxLayout()
+        refresh_button = QPushButton("Recalculate")
+        refresh_button.clicked.connect(lambda: self.parent.compute_statistics())
+        button_layout.addWidget(refresh_button)
+        button_layout.addStretch()
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def create_table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        return table
+
+    def set_loading(self):
+        self.status_label.setText("Calculating...")
+
+    def set_stats(self, stats, offline=False):
+        self.count_label.setText(f"{stats.count:,}")
+        self.total_price_label.setText(f"${stats.total_price:,.2f}")
+        self.average_price_label.setText(f"${stats.average_price:,.2f}")
+
+        top_authors = stats.top_authors(TOP_AUTHORS_SHOWN)
+        if len(stats.authors) > len(top_authors):
+            self.authors_label.setText(f"Books per author (top {len(top_authors)} of {len(stats.authors):,})")
+        else:
+            self.authors_label.setText("Books per author")
+        self.author_table.setRowCount(len(top_authors))
+        for row, (author_name, count) in enumerate(top_authors):
+            self.author_table.setItem(row, 0, QTableWidgetItem(author_name or "(no author)"))
+            self.author_table.setItem(row, 1, self.number_item(f"{count:,}"))
+
+        self.field_table.setRowCount(len(stats.field_names))
+        for row, field_name in enumerate(stats.field_names):
+            self.field_table.setItem(row, 0, QTableWidgetItem(field_name))
+            self.field_table.setItem(row, 1, self.number_item(f"{stats.filled[field_name]:,}"))
+            self.field_table.setItem(row, 2, self.number_item(f"{stats.fill_rate(field_name):.1%}"))
+
+        self.status_label.setText("Offline: only books saved on this computer are counted." if offline else "")
+
+    def number_item(self, text):
+        item = QTableWidgetItem(text)
+        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        return item
@@ -0,0 +1,58 @@
+import os
+import sys
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QSettings
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+import book_management_app
+from book_management_app import BookManagementApp
+
+class OfflineHandler:
+    """Stands in for DatabaseHandler where only whether books are stored matters"""
+    def has_storage(self):
+        return True
+
+    def set_projected_fields(self, custom_field_names):
+        pass
+
+@pytest.fixture
+def window(tmp_path, monkeypatch):
+    # Keep the test's settings away from the user's own
+    QSettings.setPath(QSettings.NativeFormat, QSettings.UserScope, str(tmp_path))
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, str(tmp_path))
+    # The database is opened once the event loop runs, which the test never lets it do
+    monkeypatch.setattr(BookManagementApp, "open_database", lambda self: None)
+    window = BookManagementApp()
+    window.db_handler = OfflineHandler()
+    yield window
+    window.metrics_timer.stop()
+    window.deleteLater()
+
+def test_custom_field_change_keeps_loaded_books(window, monkeypatch):
+    reloads = []
+    monkeypatch.setattr(window, "reload_books", lambda: reloads.append(True))
+
+    window.settings.set_custom_fields([{"name": "Genre", "required": False}])
+    window.settings.set_custom_fields([])
+
+    assert reloads == []
+    assert window.search_terms == book_management_app.EMPTY_SEARCH_TERMS
+
+def test_removing_searched_field_requeries(window, monkeypatch):
+    window.settings.set_custom_fields([{"name": "Genre", "required": False}])
+    window.search_field_combo.setCurrentIndex(window.search_field_combo.findData("Genre"))
+    window.search_field_input.setText("Fantasy")
+    window.reload_books = lambda: None
+    window.apply_search()
+
+    reloads = []
+    monkeypatch.setattr(window, "reload_books", lambda: reloads.append(True))
+    window.settings.set_custom_fields([])
+
+    assert reloads == [True]
+    assert window.search_terms["field_name"] == ""
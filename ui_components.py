@@ -1,5 +1,6 @@
+import importlib.util
 from PyQt5.QtWidgets import (QMessageBox, QPushButton, QDialog, QVBoxLayout, 
-                            QHBoxLayout, QLabel, QComboBox, QFileDialog)
+                            QHBoxLayout, QLabel, QComboBox, QFileDialog, QProgressDialog)
 from PyQt5.QtGui import QColor, QPalette
 from PyQt5.QtCore import Qt
 
@@ -30,6 +31,20 @@ def create_confirmation_dialog(parent, title, message, dark_mode=False):
     
     return msg_box
     
+def create_progress_dialog(parent, title, message):
+    """Create a window-modal progress dialog with a Cancel button for background tasks"""
+    progress_dialog = QProgressDialog(message, "Cancel", 0, 0, parent)
+    progress_dialog.setWindowTitle(title)
+    progress_dialog.setWindowModality(Qt.WindowModal)
+    progress_dialog.setMinimumDuration(0)
+    progress_dialog.setAutoReset(False)
+    progress_dialog.setAutoClose(False)
+    return progress_dialog
+
+def update_progress_dialog(progress_dialog, done, total):
+    progress_dialog.setMaximum(total)
+    progress_dialog.setValue(done)
+    
 def get_dark_palette():
     palette = QPalette()
     
@@ -77,6 +92,18 @@ def get_preferences_button_style():
         }
     """
 
+# Export formats offered by ExportDialog: (label, format, file filter, extension)
+EXPORT_FORMATS = [
+    ("CSV (.csv)", "csv", "CSV Files (*.csv)", ".csv"),
+    ("JSON (.json)", "json", "JSON Files (*.json)", ".json"),
+    ("JSON Lines (.jsonl)", "jsonl", "JSON Lines Files (*.jsonl)", ".jsonl"),
+    ("JSON Lines, gzip (.jsonl.gz)", "jsonl.gz", "Compressed JSON Lines Files (*.jsonl.gz)", ".jsonl.gz"),
+    ("JSON Lines, Zstandard (.jsonl.zst)", "jsonl.zst", "Compressed JSON Lines Files (*.jsonl.zst)", ".jsonl.zst"),
+    ("Excel (.xlsx)", "xlsx", "Excel Files (*.xlsx)", ".xlsx"),
+    ("Parquet (.parquet)", "parquet", "Parquet Files (*.parquet)", ".parquet"),
+    ("Arrow (.arrow)", "arrow", "Arrow Files (*.arrow *.feather)", ".arrow"),
+]
+
 class ExportDialog(QDialog):
     def __init__(self, parent=None, dark_mode=False):
         super().__init__(parent)
@@ -96,8 +123,19 @@ class ExportDialog(QDialog):
         format_layout = QHBoxLayout()
         format_layout.addWidget(QLabel("Export Format:"))
         
+        # Loaded here rather than at startup, like the exporters themselves
+        from book_exporter import OPTIONAL_MODULES
         self.format_combo = QComboBox()
-        self.format_combo.addItems(["CSV (.csv)", "JSON (.json)", "Excel (.xlsx)"])
+        for index, (label, export_format, _, _) in enumerate(EXPORT_FORMATS):
+            module_name = OPTIONAL_MODULES.get(export_format)
+            if module_name and importlib.util.find_spec(module_name) is None:
+                # Offered, but greyed out until the package is installed
+                self.format_combo.addItem(f"{label} - needs {module_name}")
+                self.format_combo.model().item(index).setEnabled(False)
+                self.format_combo.setItemData(index, f"Install it with: pip install {module_name}",
+                                              Qt.ToolTipRole)
+            else:
+                self.format_combo.addItem(label)
         format_layout.addWidget(self.format_combo)
         
         layout.addLayout(format_layout)
@@ -158,19 +196,7 @@ class ExportDialog(QDialog):
             """)
     def on_export_clicked(self):
         # Get selected format
-        selected_text = self.format_combo.currentText()
-        if "CSV" in selected_text:
-            self.selected_format = "csv"
-            file_filter = "CSV Files (*.csv)"
-            default_ext = ".csv"
-        elif "JSON" in selected_text:
-            self.selected_format = "json"
-            file_filter = "JSON Files (*.json)"
-            default_ext = ".json"
-        else:  # Excel
-            self.selected_format = "xlsx"
-            file_filter = "Excel Files (*.xlsx)"
-            default_ext = ".xlsx"
+        _, self.selected_format, file_filter, default_ext = EXPORT_FORMATS[self.format_combo.currentIndex()]
         
         # Get save location
         options = QFileDialog.Options()